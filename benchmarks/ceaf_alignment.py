@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Compare CEAF alignment by confusion group with a single dense assignment
+over all the clusters in a document.
+
+Documents are generated at random: gold entities, and a system clustering made
+by moving, dropping and adding mentions.  Both methods must give the same
+totals; the times are the best of several repeats."""
+from __future__ import print_function, absolute_import
+import os
+import sys
+import getopt
+import random
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+		'..'))
+from nlp_util import ceaf, coreference, coreference_scoring
+
+
+def random_document(entities, seed, error_rate=0.2):
+	rng = random.Random(seed)
+	gold = {}
+	mention = 0
+	for entity in range(entities):
+		for _ in range(rng.randint(1, 6)):
+			gold[0, mention, mention + 1] = entity
+			mention += 1
+	auto = {}
+	next_id = entities
+	for mention, entity in gold.items():
+		roll = rng.random()
+		if roll < error_rate / 3:
+			continue  # missing mention
+		elif roll < 2 * error_rate / 3:
+			auto[mention] = rng.randrange(entities)  # wrong entity
+		elif roll < error_rate:
+			auto[mention] = next_id  # split off
+			next_id += 1
+		else:
+			auto[mention] = entity
+	for extra in range(int(len(gold) * error_rate / 3)):
+		auto[1, extra, extra + 1] = rng.randrange(next_id)
+	return gold, auto
+
+
+def dense(gold_by_id, auto_by_id, similarity):
+	gold_clusters = list(gold_by_id.values())
+	auto_clusters = list(auto_by_id.values())
+	weights = []
+	for gcluster in gold_clusters:
+		row = {}
+		for i, acluster in enumerate(auto_clusters):
+			if not gcluster.isdisjoint(acluster):
+				row[i] = similarity(gcluster, acluster)
+		weights.append(row)
+	return ceaf.max_assignment(weights, len(auto_clusters))
+
+
+def sparse(gold, auto, gold_by_id, auto_by_id, similarity):
+	groups = coreference.confusion_groups(gold, auto, gold_by_id, auto_by_id)
+	return ceaf.alignment(groups, similarity)
+
+
+def best_time(function, repeats):
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		ans = function()
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return ans, best
+
+
+def main():
+	try:
+		opts, args = getopt.gnu_getopt(sys.argv[1:], '',
+				['entities=', 'repeats=', 'seed='])
+		if len(args) != 0:
+			raise ValueError(args)
+		opts = dict(opts)
+		sizes = opts.get('--entities', '25,50,100,200').split(',')
+		sizes = [int(size) for size in sizes]
+		repeats = int(opts.get('--repeats', 3))
+		seed = int(opts.get('--seed', 0))
+	except (getopt.GetoptError, ValueError):
+		print('Benchmark CEAF alignment, dense vs. by confusion group')
+		print('./%s [--entities=N,N,...] [--repeats=N] [--seed=N]' % sys.argv[0])
+		return
+
+	print("%8s %8s %12s %12s %8s" % ('entities', 'metric', 'dense (s)',
+			'sparse (s)', 'speedup'))
+	for entities in sizes:
+		gold, auto = random_document(entities, seed)
+		gold_by_id = coreference_scoring.clusters_by_id(gold)
+		auto_by_id = coreference_scoring.clusters_by_id(auto)
+		for name, similarity in [('ceafm', ceaf.mention_similarity),
+				('ceafe', ceaf.entity_similarity)]:
+			dense_total, dense_time = best_time(
+					lambda: dense(gold_by_id, auto_by_id, similarity), repeats)
+			sparse_total, sparse_time = best_time(
+					lambda: sparse(gold, auto, gold_by_id, auto_by_id,
+						similarity), repeats)
+			if abs(dense_total - sparse_total) > 1e-6:
+				raise Exception("Alignments differ: %s %s" % (dense_total,
+						sparse_total))
+			print("%8d %8s %12.4f %12.4f %7.1fx" % (entities, name, dense_time,
+					sparse_time, dense_time / max(sparse_time, 1e-9)))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Time each stage of the analysis and report the results as JSON.
+
+By default a synthetic corpus is generated (see synthetic_corpus.py) in a
+temporary directory, or in <dir> if one is given, where it is kept.  Real data
+can be used instead with --gold and --system.  Each stage is timed over the
+whole corpus, and the best of --repeats runs is reported, along with the number
+of calls and tokens per second, e.g.:
+
+  ./benchmarks/stages.py --documents=50 --output=results.json"""
+from __future__ import print_function, absolute_import
+import os
+import sys
+import getopt
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from io import StringIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+		'..'))
+import synthetic_corpus
+import classify_coreference_errors as classify
+from nlp_util import (coreference, coreference_reading, coreference_rendering,
+		head_finder, treebanks)
+
+STAGES = [
+		'read_conll_doc', 'read_system_output', 'conll_read_tree',
+		'collins_find_heads', 'match_boundaries', 'confusion_groups', 'repair',
+		'categorise', 'print_conll_style_part', 'print_mention_list',
+		'print_mention_text', 'print_cluster_errors', 'print_cluster_missing',
+		'print_cluster_extra', 'process_document',
+]
+
+
+class StageTimer:
+	"""Accumulates the time spent in each stage."""
+
+	def __init__(self):
+		self.seconds = defaultdict(float)
+		self.calls = defaultdict(int)
+
+	def run(self, stage, function, *args):
+		start = time.perf_counter()
+		ans = function(*args)
+		self.seconds[stage] += time.perf_counter() - start
+		self.calls[stage] += 1
+		return ans
+
+
+def fresh_doc(doc):
+	"""A copy that can be modified, as process_document does, without
+	affecting later repeats."""
+	ans = dict(doc)
+	ans['mentions'] = dict(doc['mentions'])
+	ans['clusters'] = {key: list(value) for key, value in doc['clusters'].items()}
+	return ans
+
+
+def time_reading(timer, gold_files, system_file):
+	gold = defaultdict(lambda: {})
+	for filename in gold_files:
+		timer.run('read_conll_doc', coreference_reading.read_conll_doc,
+				filename, gold)
+	auto = timer.run('read_system_output',
+			coreference_reading.read_conll_coref_system_output, system_file)
+	for filename in gold_files:
+		with open(filename) as source:
+			parses = timer.run('conll_read_tree', treebanks.read_trees, source,
+					treebanks.conll_read_tree)
+		for parse in parses:
+			timer.run('collins_find_heads', head_finder.collins_find_heads,
+					parse)
+	return gold, auto
+
+
+def time_classify(timer, parts, lang):
+	for doc, part, gold_doc, auto_doc in parts:
+		gold_doc = fresh_doc(gold_doc)
+		auto_doc = fresh_doc(auto_doc)
+		text = gold_doc['text']
+		parses = gold_doc['parses']
+		heads = gold_doc['heads']
+		gold_mentions = gold_doc['mentions']
+		gold_clusters = gold_doc['clusters']
+		auto_mentions = auto_doc['mentions']
+		auto_clusters = auto_doc['clusters']
+		gold_mention_set = coreference.set_of_mentions(gold_clusters)
+		auto_mention_set = coreference.set_of_mentions(auto_clusters)
+		timer.run('match_boundaries', classify.match_boundaries,
+				gold_mention_set, auto_mention_set, auto_mentions, auto_clusters,
+				text, parses, heads)
+		features = coreference.MentionFeatures(text, parses, heads, lang)
+		groups = timer.run('confusion_groups', coreference.confusion_groups,
+				gold_mentions, auto_mentions, gold_clusters, auto_clusters)
+		for auto, gold in groups:
+			changes = timer.run('repair', classify.repair, auto, gold,
+					auto_mentions, gold_mention_set, features, gold_clusters,
+					gold_mentions, gold_doc)
+			timer.run('categorise', classify.categorise, auto, gold, changes,
+					features, gold_mention_set, auto_mentions, gold_doc)
+		timer.run('print_conll_style_part',
+				coreference_rendering.print_conll_style_part, StringIO(), text,
+				auto_mentions, doc, part)
+
+
+def time_rendering(timer, parts):
+	for doc, part, gold_doc, auto_doc in parts:
+		text = gold_doc['text']
+		parses = gold_doc['parses']
+		heads = gold_doc['heads']
+		gold_mentions = gold_doc['mentions']
+		gold_clusters = gold_doc['clusters']
+		auto_mentions = auto_doc['mentions']
+		auto_clusters = auto_doc['clusters']
+		gold_cluster_set = coreference.set_of_clusters(gold_clusters)
+		auto_cluster_set = coreference.set_of_clusters(auto_clusters)
+		auto_mention_set = coreference.set_of_mentions(auto_clusters)
+		timer.run('print_mention_list', coreference_rendering.print_mention_list,
+				StringIO(), gold_mentions, auto_mention_set, parses, heads, text)
+		timer.run('print_mention_text', coreference_rendering.print_mention_text,
+				StringIO(), gold_mentions, auto_mention_set, parses, heads, text)
+		groups = coreference.confusion_groups(gold_mentions, auto_mentions,
+				gold_clusters, auto_clusters)
+		covered = timer.run('print_cluster_errors',
+				coreference_rendering.print_cluster_errors, groups, StringIO(),
+				StringIO(), text, parses, heads, auto_clusters, gold_clusters,
+				gold_mentions)
+		timer.run('print_cluster_missing',
+				coreference_rendering.print_cluster_missing, StringIO(),
+				StringIO(), StringIO(), text, gold_cluster_set, covered, parses,
+				heads)
+		timer.run('print_cluster_extra',
+				coreference_rendering.print_cluster_extra, StringIO(), StringIO(),
+				StringIO(), text, auto_cluster_set, covered, parses, heads)
+
+
+def time_process_document(timer, parts, lang):
+	for doc, part, gold_doc, auto_doc in parts:
+		out = {name: StringIO() for name, _suffix in classify.OUTPUT_FILES}
+		timer.run('process_document', classify.process_document, doc, part,
+				fresh_doc(gold_doc), fresh_doc(auto_doc), out, lang, True, None,
+				defaultdict(dict))
+
+
+def run_once(gold_files, system_file, lang):
+	timer = StageTimer()
+	gold, auto = time_reading(timer, gold_files, system_file)
+	parts = list(coreference_reading.sorted_matching_parts(auto, gold))
+	time_classify(timer, parts, lang)
+	time_rendering(timer, parts)
+	time_process_document(timer, parts, lang)
+	tokens = 0
+	for _doc, _part, gold_doc, _auto_doc in parts:
+		tokens += sum(len(sentence) for sentence in gold_doc['text'])
+	return timer, len(parts), tokens
+
+
+def find_gold_files(gold_dir):
+	ans = []
+	for root, _dirs, files in os.walk(gold_dir):
+		for filename in files:
+			if 'gold' in filename and filename.endswith('conll'):
+				ans.append(os.path.join(root, filename))
+	return sorted(ans)
+
+
+def current_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+				cwd=os.path.dirname(os.path.abspath(__file__)),
+				stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def main():
+	try:
+		opts, args = getopt.gnu_getopt(sys.argv[1:], '',
+				synthetic_corpus.OPTIONS + ['gold=', 'system=', 'lang=',
+				'repeats=', 'output='])
+		if len(args) > 1:
+			raise ValueError(args)
+		opts = dict(opts)
+		settings = synthetic_corpus.corpus_settings(opts)
+		repeats = int(opts.get('--repeats', 3))
+		if ('--gold' in opts) != ('--system' in opts):
+			raise ValueError("--gold and --system go together")
+	except (getopt.GetoptError, ValueError):
+		print('Time each stage of the coreference error analysis')
+		print('./%s [<dir>] %s [--gold=<dir> --system=<file>] [--lang=<en|nl>] '
+				'[--repeats=N] [--output=<file>]' % (sys.argv[0],
+				synthetic_corpus.USAGE))
+		return
+	lang = opts.get('--lang', 'en')
+
+	directory = None
+	if '--gold' in opts:
+		gold_dir, system_file = opts['--gold'], opts['--system']
+		corpus = {'gold': gold_dir, 'system': system_file}
+	else:
+		if len(args) == 1:
+			directory = args[0]
+		else:
+			directory = tempfile.mkdtemp(prefix='coref_bench_')
+		gold_dir, system_file, _tokens = synthetic_corpus.generate(directory,
+				**settings)
+		corpus = dict(settings, synthetic=True)
+	gold_files = find_gold_files(gold_dir)
+
+	best = {}
+	calls = {}
+	try:
+		for _ in range(repeats):
+			timer, part_count, tokens = run_once(gold_files, system_file, lang)
+			for stage in timer.seconds:
+				if stage not in best or timer.seconds[stage] < best[stage]:
+					best[stage] = timer.seconds[stage]
+				calls[stage] = timer.calls[stage]
+	finally:
+		if directory is not None and len(args) == 0:
+			shutil.rmtree(directory)
+
+	corpus['parts'] = part_count
+	corpus['tokens'] = tokens
+	results = {
+			'commit': current_commit(),
+			'python': platform.python_version(),
+			'repeats': repeats,
+			'corpus': corpus,
+			'stages': {},
+	}
+	for stage in STAGES:
+		if stage in best:
+			seconds = best[stage]
+			results['stages'][stage] = {
+					'seconds': round(seconds, 6),
+					'calls': calls[stage],
+					'tokens_per_second': round(tokens / seconds) if seconds > 0
+						else None,
+			}
+	text = json.dumps(results, indent=2, sort_keys=True)
+	if '--output' in opts:
+		with open(opts['--output'], 'w') as out:
+			print(text, file=out)
+	else:
+		print(text)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Generate gold and system coreference files in the CoNLL-2012 format.
+
+Sentences are built from a small grammar, so every file has parse trees (with
+nested NPs, names and pronouns), NER spans and coreference clusters.  The
+system output is the gold clustering with errors introduced at the given rates:
+
+  span      a mention gains or loses a word at one end
+  missing   a mention is left out
+  wrong     a mention is put in another cluster
+  divided   part of a cluster becomes a new cluster
+  extra     an NP that is not a gold mention is added to a cluster
+
+Gold files are written to <dir>/gold/bench/synth/<doc>.v4_gold_conll, and the
+system output for all documents to <dir>/system.conll."""
+from __future__ import print_function, absolute_import
+import os
+import sys
+import getopt
+import random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+		'..'))
+from nlp_util import coreference_rendering
+
+DEFAULT_RATES = {
+		'span': 0.05, 'missing': 0.1, 'wrong': 0.05, 'divided': 0.1,
+		'extra': 0.1,
+}
+
+WORDS = {
+		'DT': ['the', 'a', 'this', 'that'],
+		'JJ': ['small', 'large', 'new', 'old', 'local', 'federal', 'early'],
+		'NN': ['company', 'report', 'market', 'city', 'plan', 'group', 'deal',
+			'board', 'price', 'office'],
+		'NNP': ['Smith', 'Jones', 'Acme', 'Boston', 'Chen', 'Garcia', 'Apex',
+			'Berlin', 'Patel', 'Nakamura'],
+		'PRP': ['he', 'she', 'it', 'they'],
+		'VBD': ['said', 'bought', 'saw', 'made', 'sold', 'joined', 'left'],
+		'IN': ['in', 'of', 'with', 'for', 'near'],
+		'NER': ['PERSON', 'ORG', 'GPE'],
+}
+
+
+def leaf(rng, pos):
+	return (pos, rng.choice(WORDS[pos]))
+
+
+def noun_phrase(rng, depth=0):
+	"""A tree is (label, [children]), a leaf is (POS, word)."""
+	roll = rng.random()
+	if roll < 0.15:
+		return ('NP', [leaf(rng, 'PRP')])
+	if roll < 0.35:
+		names = [leaf(rng, 'NNP') for _ in range(rng.randint(1, 2))]
+		return ('NP', names)
+	words = [leaf(rng, 'DT')]
+	if rng.random() < 0.4:
+		words.append(leaf(rng, 'JJ'))
+	words.append(leaf(rng, 'NN'))
+	if depth < 2 and rng.random() < 0.3:
+		# Nested NP, e.g. (NP (NP the plan) (PP of (NP the city)))
+		return ('NP', [('NP', words), ('PP', [leaf(rng, 'IN'),
+				noun_phrase(rng, depth + 1)])])
+	return ('NP', words)
+
+
+def count_words(tree):
+	if isinstance(tree[1], str):
+		return 1
+	return sum(count_words(child) for child in tree[1])
+
+
+def sentence(rng, length):
+	"""A sentence with at least length words (or close to it)."""
+	subject = noun_phrase(rng)
+	verb_phrase = [leaf(rng, 'VBD'), noun_phrase(rng)]
+	total = count_words(subject) + 3
+	while total < length:
+		pp = ('PP', [leaf(rng, 'IN'), noun_phrase(rng)])
+		verb_phrase.append(pp)
+		total += count_words(pp)
+	return ('TOP', [('S', [subject, ('VP', verb_phrase), ('.', '.')])])
+
+
+def conll_rows(tree):
+	"""(word, POS, parse bit, NER) for each word, and the NP spans."""
+	rows = []
+	nps = []
+
+	def walk(node, opening):
+		label, children = node
+		if isinstance(children, str):
+			rows.append([children, label, opening + '*', '*'])
+			return
+		start = len(rows)
+		for i, child in enumerate(children):
+			walk(child, opening + '(' + label if i == 0 else '')
+		rows[-1][2] += ')'
+		if label == 'NP':
+			nps.append((start, len(rows)))
+			if all(child[0] == 'NNP' for child in children):
+				name = WORDS['NNP'].index(children[0][1])
+				name = WORDS['NER'][name % len(WORDS['NER'])]
+				if len(rows) - start == 1:
+					rows[start][3] = '(%s)' % name
+				else:
+					rows[start][3] = '(%s*' % name
+					rows[-1][3] = '*)'
+
+	walk(tree, '')
+	return rows, nps
+
+
+def make_part(rng, sentences, length, clusters, rates):
+	"""Return text, CoNLL rows, gold mentions and system mentions."""
+	text = []
+	rows = []
+	nps = []
+	for i in range(sentences):
+		srows, snps = conll_rows(sentence(rng, length))
+		text.append([row[0] for row in srows])
+		rows.append(srows)
+		nps += [(i, start, end) for start, end in snps]
+
+	# Gold: clusters of NPs, each with at least two mentions
+	rng.shuffle(nps)
+	size = min(len(nps) // 2, clusters * 4)
+	gold = {}
+	for i, mention in enumerate(nps[:size]):
+		gold[mention] = i % max(1, min(clusters, size // 2))
+	unused = nps[size:]
+
+	# System: the gold clusters with errors
+	auto = {}
+	next_id = clusters
+	divided = {}
+	for mention in sorted(gold):
+		cluster = gold[mention]
+		if rng.random() < rates['missing']:
+			continue
+		if rng.random() < rates['wrong']:
+			cluster = rng.randrange(max(1, clusters))
+		if rng.random() < rates['divided']:
+			if cluster not in divided:
+				divided[cluster] = next_id
+				next_id += 1
+			cluster = divided[cluster]
+		if rng.random() < rates['span']:
+			sentence_length = len(text[mention[0]])
+			if mention[2] < sentence_length and rng.random() < 0.5:
+				mention = (mention[0], mention[1], mention[2] + 1)
+			elif mention[2] - mention[1] > 1:
+				mention = (mention[0], mention[1] + 1, mention[2])
+		auto[mention] = cluster
+	for mention in unused:
+		if rng.random() < rates['extra']:
+			auto[mention] = rng.randrange(next_id)
+	return text, rows, gold, auto
+
+
+def write_gold_part(out, doc, part, rows, gold):
+	column = coreference_rendering.conll_coref_column(gold)
+	print("#begin document (%s); part %03d" % (doc, part), file=out)
+	for i, srows in enumerate(rows):
+		for j, (word, pos, parse, ner) in enumerate(srows):
+			fields = [doc, str(part), str(j), word, pos, parse, '-', '-', '-',
+					'Speaker#1', ner, '*', column.get((i, j), '-')]
+			print('   '.join(fields), file=out)
+		print(file=out)
+	print("#end document", file=out)
+
+
+def generate(directory, documents=10, parts=1, sentences=20, length=20,
+		clusters=15, rates=None, seed=0):
+	"""Write a corpus, returning (gold directory, system file, token count)."""
+	if rates is None:
+		rates = DEFAULT_RATES
+	rng = random.Random(seed)
+	gold_dir = os.path.join(directory, 'gold')
+	doc_dir = os.path.join(gold_dir, 'bench', 'synth')
+	if not os.path.exists(doc_dir):
+		os.makedirs(doc_dir)
+	system_file = os.path.join(directory, 'system.conll')
+	tokens = 0
+	with open(system_file, 'w') as system:
+		for number in range(documents):
+			name = 'doc_%05d' % number
+			doc = 'bench/synth/' + name
+			with open(os.path.join(doc_dir, name + '.v4_gold_conll'),
+					'w') as gold_out:
+				for part in range(parts):
+					text, rows, gold, auto = make_part(rng, sentences, length,
+							clusters, rates)
+					tokens += sum(len(words) for words in text)
+					write_gold_part(gold_out, doc, part, rows, gold)
+					coreference_rendering.print_conll_style_part(system, text,
+							auto, doc, '%03d' % part)
+	return gold_dir, system_file, tokens
+
+
+def parse_rates(spec):
+	"""Parse 'span:0.1,missing:0.2' into a complete dict of rates."""
+	rates = dict(DEFAULT_RATES)
+	if spec:
+		for entry in spec.split(','):
+			name, value = entry.split(':')
+			if name not in rates:
+				raise ValueError("Unknown error type: %s" % name)
+			rates[name] = float(value)
+	return rates
+
+
+# Options shared with stages.py
+OPTIONS = ['documents=', 'parts=', 'sentences=', 'length=', 'clusters=',
+		'errors=', 'seed=']
+USAGE = ('[--documents=N] [--parts=N] [--sentences=N] [--length=N] '
+		'[--clusters=N] [--errors=<type:rate,...>] [--seed=N]')
+
+
+def corpus_settings(opts):
+	return {
+			'documents': int(opts.get('--documents', 10)),
+			'parts': int(opts.get('--parts', 1)),
+			'sentences': int(opts.get('--sentences', 20)),
+			'length': int(opts.get('--length', 20)),
+			'clusters': int(opts.get('--clusters', 15)),
+			'rates': parse_rates(opts.get('--errors')),
+			'seed': int(opts.get('--seed', 0)),
+	}
+
+
+def main():
+	try:
+		opts, args = getopt.gnu_getopt(sys.argv[1:], '', OPTIONS)
+		directory, = args
+		settings = corpus_settings(dict(opts))
+	except (getopt.GetoptError, ValueError):
+		print('Generate a synthetic coreference corpus')
+		print('./%s <dir> %s' % (sys.argv[0], USAGE))
+		return
+	gold_dir, system_file, tokens = generate(directory, **settings)
+	print("Wrote %d tokens: gold files in %s, system output in %s" %
+			(tokens, gold_dir, system_file))
+
+
+if __name__ == '__main__':
+	main()
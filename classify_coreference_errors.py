@@ -1,26 +1,143 @@
 #!/usr/bin/env python3
 from __future__ import print_function, absolute_import
 import sys
-import string
 import getopt
-from collections import defaultdict
+import itertools
+import multiprocessing
+from collections import defaultdict, deque
+from io import StringIO
 from nlp_util import (coreference, init, coreference_reading,
-		coreference_rendering, head_finder, nlp_eval)
+		coreference_rendering, head_finder, nlp_eval, conll_cache,
+		buffered_output, coreference_scoring, timing, profiling,
+		gold_manifest, conll_index)
+
+# (key in the out dictionary, filename suffix) for each output file
+OUTPUT_FILES = [
+		('out', '.classified.detailed'),
+		('properties', '.classified.properties'),
+		('short out', '.classified'),
+		('summary', '.summary'),
+		('system output', '.system'),
+		('gold', '.gold'),
+		('error: original', '.corrected.none'),
+		('error: span mismatch', '.corrected.span_errors'),
+		('error: split', '.corrected.confused_entities'),
+		('error: extra mention', '.corrected.extra_mention'),
+		('error: extra entity', '.corrected.extra_entity'),
+		('error: merge', '.corrected.divided'),
+		('error: missing mention', '.corrected.missing_mention'),
+		('error: missing entity', '.corrected.missing_entity'),
+		('error: extra mention prog', '.corrected.extra_mention_prog'),
+		('error: extra entity prog', '.corrected.extra_entity_prog'),
+		('error: merge prog', '.corrected.divided_prog'),
+		('error: missing mention prog', '.corrected.missing_mention_prog'),
+		('error: missing entity prog', '.corrected.missing_entity_prog'),
+		('impact', '.impact'),
+]
+
+# Outputs only written when asked for, with --outputs or their own flag
+OPTIONAL_OUTPUTS = set(['impact'])
+
+# Corrected versions of the system output that are scored for the impact
+# table, each with the version it is compared against
+IMPACT_ROWS = [
+		('error: original', None),
+		('error: span mismatch', 'error: original'),
+		('error: split', 'error: span mismatch'),
+		('error: extra mention', 'error: span mismatch'),
+		('error: extra entity', 'error: span mismatch'),
+		('error: merge', 'error: span mismatch'),
+		('error: missing mention', 'error: span mismatch'),
+		('error: missing entity', 'error: span mismatch'),
+		('error: extra mention prog', 'error: split'),
+		('error: extra entity prog', 'error: extra mention prog'),
+		('error: merge prog', 'error: extra entity prog'),
+		('error: missing mention prog', 'error: merge prog'),
+		('error: missing entity prog', 'error: missing mention prog'),
+]
+
+# Explanation at the top of the .classified.properties file
+PROPERTIES_HEADER = '''# Each line below describes a single error.
+# The fields included for the seven error types are:
+# span mismatch
+#   System span (sentence, start, end)
+#   Gold span (sentence, start, end)
+#   Is the gold span a node in the gold parse?
+#   Extra text to left
+#   Missing text to left
+#   Extra text to right
+#   Missing text to right
+#   Nodes spanning extra text to left
+#   Nodes spanning missing text to left
+#   Nodes spanning extra text to right
+#   Nodes spanning missing text to right
+#
+# missing and extra entity
+#   Missing or extra
+#   Size
+#   Number of proper names
+#   Number of nominals
+#   Number of pronouns
+#   If it is 1 pronoun and 1 nominal/name, the pronoun
+#   Number of cataphoric pronouns
+#   NER types assigned to mentions in this cluster
+#   Is there an exact string match for all mentions?
+#   Is there a head match for all mentions?
+#
+# extra and missing mentions
+#   Missing or extra
+#   Mention type
+#   The mention
+#   Is there an exact match with something in the cluster?
+#   Is there a head match with something in the cluster?
+#   Is this a nested mention?
+#   Was this the first mention in the cluster?
+#   Was this the last mention in the cluster?
+#   Was this a case of cataphoa?
+#   Does NER match?
+#   Does number match?
+#   Does person match?
+#   Does gender match?
+#
+# split and merge (conflated entities and divided entity)
+#   Split or merge
+#   Size of the part being split/merged ('part' for the rest of these notes)
+#   Size of the rest of the cluster ('rest' for the rest of these notes)
+#   If the part is a single mention, its text
+#   The number of cataphoric pronouns in the part
+#   Number of names in the part
+#   Number of nominals in the part
+#   Number of pronouns in the part
+#   Number of names in the rest
+#   Number of nominals in the rest
+#   Number of pronouns in the rest
+#   Whether the mentions in the part are extra
+#   Whether the rest is made up of extra mentions
+#   Is there an exact string match between a mention in the part and one in the rest?
+#   Is there a head match between a mention in the part and one in the rest?
+#   Will this part be merged or deleted later?
+#   Has this part been split or introduced earlier?
+#   NER type(s) of part and rest match
+#   NER types of the part
+#   NER types of the rest
+#   Number type(s) of part and rest match
+#   Number types of the part
+#   Number types of the rest
+#   Gender type(s) of part and rest match
+#   Gender types of the part
+#   Gender types of the rest
+#   Person type(s) of part and rest match
+#   Person types of the part
+#   Person types of the rest
+'''
 
 
-def get_cluster_info(cluster, gold_doc, lang):
-	text = gold_doc['text']
+def get_cluster_info(cluster, gold_doc, features):
 	gold_ner = gold_doc['ner']
-	parses = gold_doc['parses']
-	heads = gold_doc['heads']
 
 	ner, number, person, gender = set(), set(), set(), set()
 	for mention in cluster:
-		mtext = coreference_rendering.mention_text(text, mention).lower()
-		parse = parses[mention[0]]
-		head = heads[mention[0]]
-		tgender, tnumber, tperson = coreference.pronoun_properties(
-				mtext, mention, parse, head, lang)
+		tgender, tnumber, tperson = features.pronoun_properties(mention)
 		if tgender != 'unknown':
 			gender.add(tgender)
 		if tnumber != 'unknown':
@@ -33,49 +150,14 @@ def get_cluster_info(cluster, gold_doc, lang):
 
 
 def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions,
-		auto_clusters, text, parses, heads):
+		auto_clusters, text, parses, heads, with_properties=True):
 	changed = set()
 	# Apply changes for cases where the difference is only leading
 	# or trailing punctuation
-	mapping = {}
-	used_gold = set()
 	unique_to_gold = gold_mention_set.difference(auto_mention_set)
 	unique_to_auto = auto_mention_set.difference(gold_mention_set)
-	for amention in unique_to_auto:
-		sentence, astart, aend = amention
-		while (astart < aend - 1
-				and (text[sentence][astart] == "the"
-					or (len(text[sentence][astart]) == 1
-						and text[sentence][astart][0]
-							not in string.ascii_letters))):
-			astart += 1
-		while (astart < aend - 1
-				and (text[sentence][aend - 1] == "'s"
-					or (len(text[sentence][aend - 1]) == 1
-						and text[sentence][aend - 1][0]
-							not in string.ascii_letters))):
-			aend -= 1
-		for gmention in unique_to_gold:
-			if gmention in used_gold:
-				continue
-			gsentence, gstart, gend = gmention
-			if sentence != gsentence:
-				continue
-			while (gstart < gend - 1
-					and (text[sentence][gstart] == "the"
-						or (len(text[sentence][gstart]) == 1
-							and text[sentence][gstart][0]
-								not in string.ascii_letters))):
-				gstart += 1
-			while (gstart < gend - 1
-					and (text[sentence][gend - 1] == "'s"
-						or (len(text[sentence][gend - 1]) == 1
-							and text[sentence][gend - 1][0]
-								not in string.ascii_letters))):
-				gend -= 1
-			if astart == gstart and aend == gend:
-				mapping[amention] = gmention
-				used_gold.add(gmention)
+	mapping = coreference.match_trimmed_mentions(unique_to_gold,
+			unique_to_auto, text)
 	# Apply mapping to create new auto_mention_set
 	for mention in mapping:
 		auto_mention_set.remove(mention)
@@ -125,6 +207,9 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions,
 	# Add notes
 	nchanges = []
 	for smention, gmention in changed:
+		if not with_properties:
+			nchanges.append((smention, gmention))
+			continue
 		properties = [smention, gmention]
 		pre_extra_text = None
 		pre_missing_text = None
@@ -158,8 +243,8 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions,
 			nodes = parses[gmention[0]].get_spanning_nodes(
 					gmention[2], smention[2])
 			post_extra_nodes = ' '.join([node.label for node in nodes])
-		snode = parses[smention[0]].get_nodes('lowest', smention[1],
-				smention[2])
+		snode = coreference_reading.get_nodes(parses, smention[0], 'lowest',
+				smention[1], smention[2])
 		properties.append(
 				"in the parse" if snode is not None else "not in the parse")
 		properties.append(pre_extra_text)
@@ -174,9 +259,9 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions,
 	return nchanges
 
 
-def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
-		gold_mentions, gold_clusters, auto_mentions,
-		gold_doc, lang):
+def split_merge_properties(part, cluster, auto, gold, features, gold_mentions,
+		gold_clusters, auto_mentions, gold_doc):
+	timing.count('split/merge properties')
 	ans = []
 	rest = cluster.difference(part)
 
@@ -190,9 +275,7 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 	mtext = None
 	if len(part) == 1:
 		mention = next(iter(part))
-		mtext = '_'.join(
-				coreference_rendering.mention_text(text,
-				mention).lower().split())
+		mtext = '_'.join(features.lower_text(mention).split())
 	ans.append(mtext)  # 2
 
 	# Does this part have any cataphoric pronouns
@@ -201,12 +284,11 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 	for mention in cluster:
 		if mention in auto_mentions:
 			acluster.add(mention)
-	non_pronoun = min_non_pronoun(acluster, text, parses, heads, lang)
+	non_pronoun = min_non_pronoun(acluster, features)
 	if non_pronoun is not None and non_pronoun not in part:
 		for mention in part:
 			if mention in auto_mentions and mention < non_pronoun:
-				mtype = coreference.mention_type(
-						mention, text, parses, heads, lang)
+				mtype = features.mention_type(mention)
 				if mtype == 'pronoun':
 					count += 1
 	ans.append("%d_cataphoric" % count)
@@ -214,7 +296,7 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 	# Number of pronouns, nominals, names present in it
 	type_counts = {'pronoun': 0, 'name': 0, 'nominal': 0}
 	for mention in part:
-		mtype = coreference.mention_type(mention, text, parses, heads, lang)
+		mtype = features.mention_type(mention)
 		type_counts[mtype] += 1
 	ans.append(type_counts['name'])  # 3
 	ans.append(type_counts['nominal'])  # 4
@@ -223,7 +305,7 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 	# Number of pronouns, nominals, names, in rest
 	type_counts = {'pronoun': 0, 'name': 0, 'nominal': 0}
 	for mention in rest:
-		mtype = coreference.mention_type(mention, text, parses, heads, lang)
+		mtype = features.mention_type(mention)
 		type_counts[mtype] += 1
 	ans.append(type_counts['name'])  # 6
 	ans.append(type_counts['nominal'])  # 7
@@ -245,46 +327,26 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 
 	# Whether there is an exact string match between a mention in the part and
 	# cluster (excluding pronouns)
+	part_nominal = [mention for mention in part
+			if features.mention_type(mention) != 'pronoun']
+	rest_nominal = [mention for mention in rest
+			if features.mention_type(mention) != 'pronoun']
+	part_texts = {features.lower_text(mention) for mention in part_nominal}
+	rest_texts = {features.lower_text(mention) for mention in rest_nominal}
 	match_present = 'no_string_match'
-	for smention in part:
-		mtype = coreference.mention_type(smention, text, parses, heads, lang)
-		if mtype == 'pronoun':
-			continue
-		for rmention in rest:
-			mtype = coreference.mention_type(rmention, text, parses, heads,
-					lang)
-			if mtype == 'pronoun':
-				continue
-			stext = coreference_rendering.mention_text(text, smention).lower()
-			rtext = coreference_rendering.mention_text(text, rmention).lower()
-			if stext == rtext:
-				match_present = 'string_match'
-				break
-		if 'no' not in match_present:
-			break
+	if not part_texts.isdisjoint(rest_texts):
+		match_present = 'string_match'
 	ans.append(match_present)  # 11
 
 	# Whether there is a head match between a mention in the part and cluster
 	# (excluding pronouns)
+	part_heads = {features.mention_head(mention)[1].lower()
+			for mention in part_nominal}
+	rest_heads = {features.mention_head(mention)[1].lower()
+			for mention in rest_nominal}
 	match_present = 'no_head_match'
-	for smention in part:
-		mtype = coreference.mention_type(smention, text, parses, heads, lang)
-		if mtype == 'pronoun':
-			continue
-		for rmention in rest:
-			mtype = coreference.mention_type(
-					rmention, text, parses, heads, lang)
-			if mtype == 'pronoun':
-				continue
-			shead = coreference.mention_head(
-					smention, text, parses, heads)[1].lower()
-			rhead = coreference.mention_head(
-					rmention, text, parses, heads)[1].lower()
-			if shead == rhead:
-				match_present = 'head_match'
-				break
-		if 'no' not in match_present:
-			break
+	if not part_heads.isdisjoint(rest_heads):
+		match_present = 'head_match'
 	ans.append(match_present)  # 12
 
 	# What has happened, or will happen
@@ -308,8 +370,8 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 	ans.append(action)  # 14
 
 	# NER, number, person, gender
-	cproperties = get_cluster_info(rest, gold_doc, lang)
-	pproperties = get_cluster_info(part, gold_doc, lang)
+	cproperties = get_cluster_info(rest, gold_doc, features)
+	pproperties = get_cluster_info(part, gold_doc, features)
 	for prop in range(4):
 		ans.append(cproperties[prop] == pproperties[prop])
 		cprop = list(cproperties[prop])
@@ -322,23 +384,23 @@ def split_merge_properties(part, cluster, auto, gold, text, parses, heads,
 	return ans
 
 
-def mention_error_properties(mention, cluster, text, parses, heads, gold_doc,
-		lang):
+def mention_error_properties(mention, cluster, features, gold_doc):
+	timing.count('mention error properties')
 	ans = []
 	rest = cluster.difference({mention})
 
 	# Type of mention
-	mtype = coreference.mention_type(mention, text, parses, heads, lang)
+	mtype = features.mention_type(mention)
 	ans.append(mtype)
 
 	# Text of mention
-	mtext = coreference_rendering.mention_text(text, mention).lower()
+	mtext = features.lower_text(mention)
 	ans.append('_'.join(mtext.split()))
 
 	# Does it have a string match with something in the cluster?
 	matches = 'no_text_match'
 	for omention in rest:
-		otext = coreference_rendering.mention_text(text, omention).lower()
+		otext = features.lower_text(omention)
 		if otext == mtext:
 			matches = 'text_match'
 			break
@@ -346,10 +408,9 @@ def mention_error_properties(mention, cluster, text, parses, heads, gold_doc,
 
 	# Does it have a head match with something in the cluster?
 	matches = 'no_head_match'
-	mhead = coreference.mention_head(mention, text, parses, heads)[1].lower()
+	mhead = features.mention_head(mention)[1].lower()
 	for omention in rest:
-		ohead = coreference.mention_head(omention, text, parses,
-				heads)[1].lower()
+		ohead = features.mention_head(omention)[1].lower()
 		if mhead == ohead:
 			matches = 'head_match'
 			break
@@ -380,12 +441,12 @@ def mention_error_properties(mention, cluster, text, parses, heads, gold_doc,
 	ans.append(mention == max(cluster))
 
 	# Is it a case of cataphora?
-	non_pronoun = min_non_pronoun(cluster, text, parses, heads, lang)
+	non_pronoun = min_non_pronoun(cluster, features)
 	ans.append(non_pronoun is not None and mention < non_pronoun)
 
 	# Do NER, number, person, or gender of mention and cluster match?
-	cluster_properties = get_cluster_info(rest, gold_doc, lang)
-	mention_properties = get_cluster_info({mention}, gold_doc, lang)
+	cluster_properties = get_cluster_info(rest, gold_doc, features)
+	mention_properties = get_cluster_info({mention}, gold_doc, features)
 	words = ['ner', 'number', 'person', 'gender']
 	for i in range(4):
 		if len(mention_properties[i]) == 0 or len(cluster_properties[i]) == 0:
@@ -399,7 +460,8 @@ def mention_error_properties(mention, cluster, text, parses, heads, gold_doc,
 	return ans
 
 
-def cluster_error_properties(cluster, text, parses, heads, gold_doc, lang):
+def cluster_error_properties(cluster, features, gold_doc):
+	timing.count('cluster error properties')
 	ans = []
 
 	# How big is the cluster
@@ -408,7 +470,7 @@ def cluster_error_properties(cluster, text, parses, heads, gold_doc, lang):
 	# Counts of each type in the cluster
 	counts = [0, 0, 0]
 	for mention in cluster:
-		mtype = coreference.mention_type(mention, text, parses, heads, lang)
+		mtype = features.mention_type(mention)
 		if mtype == 'name':
 			counts[0] += 1
 		elif mtype == 'nominal':
@@ -421,23 +483,21 @@ def cluster_error_properties(cluster, text, parses, heads, gold_doc, lang):
 	if counts[0] + counts[1] == 1 and counts[2] == 1:
 		pronoun = None
 		for mention in cluster:
-			mtype = coreference.mention_type(mention, text, parses, heads,
-					lang)
+			mtype = features.mention_type(mention)
 			if mtype == 'pronoun':
 				pronoun = mention
-		mtext = coreference_rendering.mention_text(text, pronoun).lower()
+		mtext = features.lower_text(pronoun)
 		ans.append(mtext)
 	else:
 		ans.append(None)
 
 	# Number of cataphoric pronouns
 	cataphora = 0
-	non_pronoun = min_non_pronoun(cluster, text, parses, heads, lang, True)
+	non_pronoun = min_non_pronoun(cluster, features, True)
 	if non_pronoun is not None:
 		for mention in cluster:
 			if mention < non_pronoun:
-				mtype = coreference.mention_type(mention, text, parses, heads,
-						lang)
+				mtype = features.mention_type(mention)
 				if mtype == 'pronoun':
 					cataphora += 1
 	ans.append(cataphora)
@@ -454,22 +514,21 @@ def cluster_error_properties(cluster, text, parses, heads, gold_doc, lang):
 	# Are all the mentions the same?
 	mtext = set()
 	for mention in cluster:
-		mtext.add(coreference_rendering.mention_text(text, mention).lower())
+		mtext.add(features.lower_text(mention))
 	ans.append(len(mtext) == 1)
 
 	# Are all the heads the same?
 	mhead = set()
 	for mention in cluster:
 		mhead.add(
-				coreference.mention_head(mention, text, parses,
-				heads)[1].lower())
+				features.mention_head(mention)[1].lower())
 	ans.append(len(mhead) == 1)
 
 	return ans
 
 
-def repair(auto, gold, auto_mentions, gold_mention_set, text, parses, heads,
-		gold_clusters, gold_mentions, gold_doc, lang):
+def repair(auto, gold, auto_mentions, gold_mention_set, features,
+		gold_clusters, gold_mentions, gold_doc, with_properties=True):
 	changes = defaultdict(lambda: [])
 
 	# Split auto into pieces that each contain only one cluster
@@ -482,17 +541,20 @@ def repair(auto, gold, auto_mentions, gold_mention_set, text, parses, heads,
 				nauto.append(intersection)
 				used.update(intersection)
 				if len(intersection) != len(acluster):
-					properties = ['split'] + split_merge_properties(
-							intersection, acluster, auto, gold, text, parses,
-							heads, gold_mentions, gold_clusters, auto_mentions,
-							gold_doc, lang)
+					properties = ['split']
+					if with_properties:
+						properties += split_merge_properties(
+								intersection, acluster, auto, gold, features,
+								gold_mentions, gold_clusters, auto_mentions,
+								gold_doc)
 					changes["split"].append((intersection.copy(),
 							acluster.copy(), '', properties))
 		for mention in acluster.difference(used):
-			properties = ['split'] + split_merge_properties(
-					{mention}, acluster, auto, gold, text, parses, heads,
-					gold_mentions, gold_clusters, auto_mentions, gold_doc,
-					lang)
+			properties = ['split']
+			if with_properties:
+				properties += split_merge_properties(
+						{mention}, acluster, auto, gold, features, gold_mentions,
+						gold_clusters, auto_mentions, gold_doc)
 			changes["split"].append(
 					({mention}, acluster.copy(), 'going nowhere', properties))
 			changes["remove"].append(({mention}, ))
@@ -508,39 +570,34 @@ def repair(auto, gold, auto_mentions, gold_mention_set, text, parses, heads,
 	for gcluster in gold:
 		for acluster in nauto:
 			if acluster != gcluster and acluster.issubset(gcluster):
-				properties = ['merge'] + split_merge_properties(
-						acluster, gcluster, auto, gold, text, parses, heads,
-						gold_mentions, gold_clusters, auto_mentions, gold_doc,
-						lang)
+				properties = ['merge']
+				if with_properties:
+					properties += split_merge_properties(
+							acluster, gcluster, auto, gold, features,
+							gold_mentions, gold_clusters, auto_mentions, gold_doc)
 				changes["merge"].append(
 						(acluster.copy(), gcluster.copy(), properties))
 
 	return changes
 
 
-def min_non_pronoun(cluster, text, parses, heads, lang, check_head=False):
+def min_non_pronoun(cluster, features, check_head=False):
 	ans = None
 	for mention in cluster:
-		if coreference.mention_type(mention, text, parses, heads,
-				lang) == 'pronoun':
+		if features.mention_type(mention) == 'pronoun':
 			continue
 		if check_head:
-			head = coreference.mention_head(mention,
-					text,
-					parses,
-					heads,
-					default_last=True)
-			if coreference.mention_type((mention[0], head[0][0], head[0][1]),
-					text, parses, heads,
-					lang) == 'pronoun':
+			head = features.mention_head(mention)
+			head_mention = (mention[0], head[0][0], head[0][1])
+			if features.mention_type(head_mention) == 'pronoun':
 				continue
 		if ans is None or ans > mention:
 			ans = mention
 	return ans
 
 
-def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
-		auto_mentions, gold_doc, lang):
+def categorise(auto, gold, changes, features, gold_mention_set, auto_mentions,
+		gold_doc, with_properties=True):
 	# Not an Entity
 	# A set of splits to singles that cover an entire cluster
 	to_add = defaultdict(lambda: [])
@@ -548,8 +605,7 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 		is_disjoint = True
 		for mention in split[1]:
 			if mention in gold_mention_set:
-				mtype = coreference.mention_type(mention, text, parses, heads,
-						lang)
+				mtype = features.mention_type(mention)
 				if mtype != 'pronoun':
 					is_disjoint = False
 					break
@@ -569,8 +625,10 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 			split_cluster.update(split[0])
 		if len(split_cluster) == 1:
 			continue
-		properties = ['extra'] + cluster_error_properties(
-				split_cluster, text, parses, heads, gold_doc, lang)
+		properties = ['extra']
+		if with_properties:
+			properties += cluster_error_properties(split_cluster, features,
+					gold_doc)
 		changes['extra entity'].append(
 				(split_cluster, cluster.copy(), properties))
 		for split in splits:
@@ -593,13 +651,14 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 			if mention not in auto_mentions:
 				missing += 1
 			else:
-				if coreference.mention_type(mention, text, parses, heads,
-						lang) != 'pronoun':
+				if features.mention_type(mention) != 'pronoun':
 					is_disjoint = False
 					break
 		if is_disjoint and missing > 1:
-			properties = ['missing'] + cluster_error_properties(
-					cluster, text, parses, heads, gold_doc, lang)
+			properties = ['missing']
+			if with_properties:
+				properties += cluster_error_properties(cluster, features,
+						gold_doc)
 			changes['missing entity'].append((cluster.copy(), properties))
 			for mention in cluster:
 				if mention in auto_mentions:
@@ -622,12 +681,10 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 	# mentions in the cluster
 	to_remove = []
 	for split in changes['split']:
-		if min_non_pronoun(split[0], text, parses, heads,
-				lang) == min_non_pronoun(split[1], text, parses,
-				heads, lang):
-			if min_non_pronoun(split[0], text, parses, heads,
-					lang) is None and min(split[0]) != min(
-					split[1]):
+		if min_non_pronoun(split[0], features) == min_non_pronoun(split[1],
+				features):
+			if min_non_pronoun(split[0], features) is None and min(
+					split[0]) != min(split[1]):
 				continue
 			found = False
 			for remove in changes['remove']:
@@ -643,12 +700,10 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 			changes['remove'].remove(remove)
 	to_remove = []
 	for merge in changes['merge']:
-		if min_non_pronoun(merge[0], text, parses, heads,
-				lang) == min_non_pronoun(merge[1], text, parses,
-				heads, lang):
-			if min_non_pronoun(merge[0], text, parses, heads,
-					lang) is None and min(merge[0]) != min(
-					merge[1]):
+		if min_non_pronoun(merge[0], features) == min_non_pronoun(merge[1],
+				features):
+			if min_non_pronoun(merge[0], features) is None and min(
+					merge[0]) != min(merge[1]):
 				continue
 			found = False
 			for introduce in changes['introduce']:
@@ -679,9 +734,10 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 				break
 		if to_remove is not None:
 			changes['remove'].remove(to_remove)
-		properties = ['extra'] + mention_error_properties(
-				next(iter(split[0])), split[1], text, parses, heads, gold_doc,
-				lang)
+		properties = ['extra']
+		if with_properties:
+			properties += mention_error_properties(next(iter(split[0])),
+					split[1], features, gold_doc)
 		changes['extra mention'].append((split[0], split, properties))
 
 	# Pair up introduces and merges to form incorrectly non-referential
@@ -698,12 +754,12 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 						break
 			if not elsewhere:
 				mention = list(merge[0])[0]
-				if mention != min_non_pronoun(
-						merge[1], text, parses, heads,
-						lang) and mention not in auto_mentions:
-					properties = ['missing'] + mention_error_properties(
-							mention, merge[1], text, parses, heads, gold_doc,
-							lang)
+				if mention != min_non_pronoun(merge[1],
+						features) and mention not in auto_mentions:
+					properties = ['missing']
+					if with_properties:
+						properties += mention_error_properties(mention,
+								merge[1], features, gold_doc)
 					changes['missing mention'].append(
 							({mention}, merge[1], merge, properties))
 					for introduce in changes['introduce']:
@@ -718,16 +774,14 @@ def categorise(auto, gold, changes, text, parses, heads, gold_mention_set,
 
 
 def print_pre_change_info(out, auto, gold, auto_mentions, gold_mention_set,
-		text, parses, heads, gold_clusters, gold_mentions,
-		gold_doc, auto_clusters, lang):
+		features, gold_clusters, gold_mentions, gold_doc, auto_clusters):
 	# Cataphora
 	mentions = defaultdict(lambda: [None, None, None])
 
 	for cluster in gold:
-		non_pronoun = min_non_pronoun(cluster, text, parses, heads, lang)
+		non_pronoun = min_non_pronoun(cluster, features)
 		for mention in cluster:
-			mtype = coreference.mention_type(mention, text, parses, heads,
-					lang)
+			mtype = features.mention_type(mention)
 			if mtype == 'pronoun':
 				if non_pronoun is not None and mention < non_pronoun:
 					mentions[mention][0] = True
@@ -735,10 +789,9 @@ def print_pre_change_info(out, auto, gold, auto_mentions, gold_mention_set,
 					mentions[mention][0] = False
 
 	for cluster in auto:
-		non_pronoun = min_non_pronoun(cluster, text, parses, heads, lang)
+		non_pronoun = min_non_pronoun(cluster, features)
 		for mention in cluster:
-			mtype = coreference.mention_type(mention, text, parses, heads,
-					lang)
+			mtype = features.mention_type(mention)
 			if mtype == 'pronoun':
 				if non_pronoun is not None and mention < non_pronoun:
 					mentions[mention][1] = True
@@ -752,15 +805,15 @@ def print_pre_change_info(out, auto, gold, auto_mentions, gold_mention_set,
 	for mention in in_both:
 		acluster = auto_clusters[auto_mentions[mention]]
 		gcluster = gold_clusters[gold_mentions[mention]]
-		anon_pronoun = min_non_pronoun(acluster, text, parses, heads, lang)
-		gnon_pronoun = min_non_pronoun(gcluster, text, parses, heads, lang)
+		anon_pronoun = min_non_pronoun(acluster, features)
+		gnon_pronoun = min_non_pronoun(gcluster, features)
 		if anon_pronoun == gnon_pronoun:
 			mentions[mention][2] = True
 		else:
 			mentions[mention][2] = False
 
 	for mention in mentions:
-		mtext = coreference_rendering.mention_text(text, mention).lower()
+		mtext = features.lower_text(mention)
 		print("Cataphoric properties", mentions[mention], mtext, file=out['out'])
 
 
@@ -770,7 +823,22 @@ def process_document(doc_name,
 		auto_doc,
 		out,
 		lang,
-		remove_singletons=True):
+		remove_singletons=True,
+		outputs=None,
+		scores=None):
+	# Only do the work needed for the outputs that were requested (out still
+	# has an entry for every output file, unrequested ones discard writes)
+	if outputs is None:
+		outputs = set(out)
+	render = 'out' in outputs or 'short out' in outputs
+	with_properties = 'out' in outputs or 'properties' in outputs
+	score = scores is not None and 'impact' in outputs
+	classify = with_properties or render or score or 'summary' in outputs
+	for name in outputs:
+		if name.startswith('error: ') and name not in ('error: original',
+				'error: span mismatch'):
+			classify = True
+
 	for ofile in [out['out'], out['short out']]:
 		print(file=ofile)
 		print('-' * 79, file=ofile)
@@ -813,82 +881,102 @@ def process_document(doc_name,
 	auto_cluster_set = coreference.set_of_clusters(auto_clusters)
 	gold_mention_set = coreference.set_of_mentions(gold_clusters)
 	auto_mention_set = coreference.set_of_mentions(auto_clusters)
-
-	coreference_rendering.print_conll_style_part(out['system output'], text,
-			auto_mentions, doc_name,
-			part_name)
-	coreference_rendering.print_conll_style_part(out['gold'], text,
-			gold_mentions, doc_name,
-			part_name)
-	coreference_rendering.print_conll_style_part(out['error: original'], text,
-			auto_mentions, doc_name,
-			part_name)
+	timing.count('documents')
+	timing.count('gold mentions', len(gold_mentions))
+	timing.count('system mentions', len(auto_mentions))
+
+	with timing.stage('write'):
+		coreference_rendering.print_conll_style_parts([
+				(out[name], mentions) for name, mentions in [
+					('system output', auto_mentions),
+					('gold', gold_mentions),
+					('error: original', auto_mentions),
+				] if name in outputs
+		], text, doc_name, part_name)
+
+	if score:
+		with timing.stage('score'):
+			coreference_scoring.add_counts(scores['error: original'],
+					coreference_scoring.score_part(gold_mentions, auto_mentions))
 
 	# Fix boundary match errors
 	errors = []
-	span_errors = match_boundaries(gold_mention_set, auto_mention_set,
-			auto_mentions, auto_clusters, text,
-			gold_parses, gold_heads)
-	if len(span_errors) == 0:
-		print("No", end=' ', file=out['out'])
-		print("No", end=' ', file=out['short out'])
-	print("Span Errors: (system, gold)", file=out['out'])
-	print("Span Errors: (system, gold)", file=out['short out'])
-	for error in span_errors:
-		errors.append(('span mismatch', error))
-		before = coreference_rendering.print_mention(None,
-				False,
-				gold_parses,
-				gold_heads,
-				text,
-				error[0],
-				return_str=True)
-		after = coreference_rendering.print_mention(None,
-				False,
-				gold_parses,
-				gold_heads,
-				text,
-				error[1],
-				return_str=True)
-		print('{:<50}    {:<50}'.format(before, after), file=out['out'])
-		print('{:<50}    {:<50}'.format(before, after), file=out['short out'])
-	print(file=out['out'])
-	print(file=out['short out'])
-	for error in errors:
-		print('span mismatch', error, file=out['out'])
-		print(['span error'] + list(error[1]), file=out['properties'])
-	print(file=out['out'])
-	print('-' * 79, file=out['out'])
-	print(file=out['short out'])
-	print('-' * 79, file=out['short out'])
-
-	coreference_rendering.print_conll_style_part(out['error: span mismatch'],
-			text, auto_mentions, doc_name,
-			part_name)
-
-	auto_mentions_split = auto_mentions.copy()
-	auto_mentions_extra_mention = auto_mentions.copy()
-	auto_mentions_extra_entity = auto_mentions.copy()
-	auto_mentions_merge = auto_mentions.copy()
-	auto_mentions_missing_mention = auto_mentions.copy()
-	auto_mentions_missing_entity = auto_mentions.copy()
-	auto_mentions_extra_mention_prog = auto_mentions.copy()
-	auto_mentions_extra_entity_prog = auto_mentions.copy()
-	auto_mentions_merge_prog = auto_mentions.copy()
-	auto_mentions_missing_mention_prog = auto_mentions.copy()
-	auto_mentions_missing_entity_prog = auto_mentions.copy()
+	with timing.stage('match_boundaries'):
+		span_errors = match_boundaries(gold_mention_set, auto_mention_set,
+				auto_mentions, auto_clusters, text,
+				gold_parses, gold_heads, with_properties)
+	timing.count('span errors', len(span_errors))
+	with timing.stage('render'):
+		if len(span_errors) == 0:
+			print("No", end=' ', file=out['out'])
+			print("No", end=' ', file=out['short out'])
+		print("Span Errors: (system, gold)", file=out['out'])
+		print("Span Errors: (system, gold)", file=out['short out'])
+		for error in span_errors:
+			errors.append(('span mismatch', error))
+			if not render:
+				continue
+			before = coreference_rendering.print_mention(None,
+					False,
+					gold_parses,
+					gold_heads,
+					text,
+					error[0],
+					return_str=True)
+			after = coreference_rendering.print_mention(None,
+					False,
+					gold_parses,
+					gold_heads,
+					text,
+					error[1],
+					return_str=True)
+			print('{:<50}    {:<50}'.format(before, after), file=out['out'])
+			print('{:<50}    {:<50}'.format(before, after),
+					file=out['short out'])
+		print(file=out['out'])
+		print(file=out['short out'])
+		for error in errors:
+			print('span mismatch', error, file=out['out'])
+			print(['span error'] + list(error[1]), file=out['properties'])
+		print(file=out['out'])
+		print('-' * 79, file=out['out'])
+		print(file=out['short out'])
+		print('-' * 79, file=out['short out'])
+
+	# Corrected versions of the system output, each stored as changes relative
+	# to auto_mentions.  The progressive ('prog') versions build on each other,
+	# so changes made with set_all and pop_all carry through to later stages.
+	auto_mentions_split = coreference.MentionLayer(auto_mentions)
+	auto_mentions_extra_mention = coreference.MentionLayer(auto_mentions)
+	auto_mentions_extra_entity = coreference.MentionLayer(auto_mentions)
+	auto_mentions_merge = coreference.MentionLayer(auto_mentions)
+	auto_mentions_missing_mention = coreference.MentionLayer(auto_mentions)
+	auto_mentions_missing_entity = coreference.MentionLayer(auto_mentions)
+	auto_mentions_extra_mention_prog = coreference.MentionLayer(
+			auto_mentions_split)
+	auto_mentions_extra_entity_prog = coreference.MentionLayer(
+			auto_mentions_extra_mention_prog)
+	auto_mentions_merge_prog = coreference.MentionLayer(
+			auto_mentions_extra_entity_prog)
+	auto_mentions_missing_mention_prog = coreference.MentionLayer(
+			auto_mentions_merge_prog)
+	auto_mentions_missing_entity_prog = coreference.MentionLayer(
+			auto_mentions_missing_mention_prog)
 	max_cluster = 0
 	if len(auto_mentions) > 0:
 		max_cluster = auto_mentions[max(
 				auto_mentions, key=lambda mention: auto_mentions[mention])]
 
-	groups = coreference.confusion_groups(gold_mentions, auto_mentions,
-			gold_clusters, auto_clusters)
+	features = coreference.MentionFeatures(text, gold_parses, gold_heads, lang)
+	groups = []
+	if classify:
+		groups = coreference.confusion_groups(gold_mentions, auto_mentions,
+				gold_clusters, auto_clusters)
+	timing.count('confusion groups', len(groups))
 	for auto, gold in groups:
 		# print_pre_change_info(
-		# 		out, auto, gold, auto_mentions, gold_mention_set, text,
-		# 		gold_parses, gold_heads, gold_clusters, gold_mentions,
-		# 		gold_doc, auto_clusters, lang)
+		# 		out, auto, gold, auto_mentions, gold_mention_set, features,
+		# 		gold_clusters, gold_mentions, gold_doc, auto_clusters)
 
 		if nlp_eval.coreference_cluster_match(gold, auto):
 			continue
@@ -896,17 +984,21 @@ def process_document(doc_name,
 		# Print clusters with errors shown
 		print(file=out['out'])
 		print(file=out['short out'])
-		colours = coreference_rendering.print_cluster_error_group(
-				[auto, gold], out['out'], text, gold_parses, gold_heads,
-				gold_mentions)
-		colours2 = coreference_rendering.print_cluster_error_group(
-				[auto, gold], out['short out'], text, gold_parses, gold_heads,
-				gold_mentions)
+		colours = {}
+		if render:
+			with timing.stage('render'):
+				rendered = StringIO()
+				colours = coreference_rendering.print_cluster_error_group(
+						[auto, gold], rendered, text, gold_parses, gold_heads,
+						gold_mentions)
+				out['out'].write(rendered.getvalue())
+				out['short out'].write(rendered.getvalue())
 
 		# Work out the errors
-		changes = repair(auto, gold, auto_mentions, gold_mention_set, text,
-				gold_parses, gold_heads, gold_clusters, gold_mentions,
-				gold_doc, lang)
+		with timing.stage('repair'):
+			changes = repair(auto, gold, auto_mentions, gold_mention_set,
+					features, gold_clusters, gold_mentions, gold_doc,
+					with_properties)
 		print("\nRaw changes:", file=out['out'])
 		for name in changes:
 			print(name, len(changes[name]), file=out['out'])
@@ -914,50 +1006,33 @@ def process_document(doc_name,
 				errors.append(('raw ' + name, change))
 
 		# Categorise
-		changes = categorise(auto, gold, changes, text, gold_parses,
-				gold_heads, gold_mention_set, auto_mentions,
-				gold_doc, lang)
+		with timing.stage('categorise'):
+			changes = categorise(auto, gold, changes, features,
+					gold_mention_set, auto_mentions, gold_doc, with_properties)
 
 		# Apply updates to corrected sets
 		if 'split' in changes:
 			for change in changes['split']:
 				max_cluster += 1
 				for mention in change[0]:
-					auto_mentions_split[mention] = max_cluster
-					auto_mentions_extra_mention_prog[mention] = max_cluster
-					auto_mentions_extra_entity_prog[mention] = max_cluster
-					auto_mentions_merge_prog[mention] = max_cluster
-					auto_mentions_missing_mention_prog[mention] = max_cluster
-					auto_mentions_missing_entity_prog[mention] = max_cluster
+					auto_mentions_split.set_all(mention, max_cluster)
 				rest = change[1].difference(change[0])
 				if len(rest) == 1:
 					rest = next(iter(rest))
 					if rest not in gold_mentions:
-						auto_mentions_split.pop(rest)
-						auto_mentions_extra_mention_prog.pop(rest)
-						auto_mentions_extra_entity_prog.pop(rest)
-						auto_mentions_merge_prog.pop(rest)
-						auto_mentions_missing_mention_prog.pop(rest)
-						auto_mentions_missing_entity_prog.pop(rest)
+						auto_mentions_split.pop_all(rest)
 
 		if 'extra mention' in changes:
 			for change in changes['extra mention']:
 				for mention in change[0]:
 					auto_mentions_extra_mention.pop(mention)
-					auto_mentions_extra_mention_prog.pop(mention)
-					auto_mentions_extra_entity_prog.pop(mention)
-					auto_mentions_merge_prog.pop(mention)
-					auto_mentions_missing_mention_prog.pop(mention)
-					auto_mentions_missing_entity_prog.pop(mention)
+					auto_mentions_extra_mention_prog.pop_all(mention)
 
 		if 'extra entity' in changes:
 			for change in changes['extra entity']:
 				for mention in change[0]:
 					auto_mentions_extra_entity.pop(mention)
-					auto_mentions_extra_entity_prog.pop(mention)
-					auto_mentions_merge_prog.pop(mention)
-					auto_mentions_missing_mention_prog.pop(mention)
-					auto_mentions_missing_entity_prog.pop(mention)
+					auto_mentions_extra_entity_prog.pop_all(mention)
 
 		if 'merge' in changes:
 			for change in changes['merge']:
@@ -966,8 +1041,7 @@ def process_document(doc_name,
 						auto_mentions_missing_mention_prog,
 						auto_mentions_missing_entity_prog
 				]:
-					non_pronoun = min_non_pronoun(change[1], text, gold_parses,
-							gold_heads, lang)
+					non_pronoun = min_non_pronoun(change[1], features)
 					if non_pronoun is None:
 						non_pronoun = min(change[1])
 					if non_pronoun not in cauto_mentions:
@@ -981,9 +1055,7 @@ def process_document(doc_name,
 						elif cauto_mentions[mention] not in done:
 							pcluster_id = cauto_mentions[mention]
 							done.add(pcluster_id)
-							for smention in cauto_mentions:
-								if cauto_mentions[smention] == pcluster_id:
-									cauto_mentions[smention] = ncluster_id
+							cauto_mentions.relabel(pcluster_id, ncluster_id)
 
 		if 'missing mention' in changes:
 			for change in changes['missing mention']:
@@ -1014,266 +1086,356 @@ def process_document(doc_name,
 					auto_mentions_missing_entity_prog[mention] = max_cluster
 
 		# Aggregate and count errors
-		print("\nCategorised:", file=out['out'])
-		print("\nErrors:", file=out['short out'])
-		rename = {
-				'span mismatch': "Span Error", 'split': 'Conflated Entities',
-				'extra mention': 'Extra Mention', 'extra entity':
-				'Extra Entity', 'merge': 'Divided Entity', 'missing mention':
-				'Missing Mention', 'missing entity': 'Missing Entity',
-				'introduce': 'Introduced Mention',
-		}
-		for name in changes:
-			if len(changes[name]) > 0:
-				print(len(changes[name]), rename[name], file=out['out'])
-				print(len(changes[name]), rename[name], file=out['short out'])
-		print('\nDetailed error listing:', file=out['out'])
-		for name in changes:
-			for change in changes[name]:
-				mention = None
-				if len(change[0]) == 1:
-					mention = change[0].copy().pop()
-				if mention is not None:
-					print(name, end=' ', file=out['out'])
-					if mention in gold_mentions:
-						colour = 15
-						if gold_mentions[mention] in colours:
-							colour = colours[gold_mentions[mention]]
-						coreference_rendering.print_mention(
-								out['out'], False, gold_parses, gold_heads,
-								text, mention, colour)
-					else:
-						coreference_rendering.print_mention(out['out'],
-								False,
-								gold_parses,
-								gold_heads,
-								text,
-								mention,
-								extra=True)
-				print(name, change, file=out['out'])
-				print("Properties included:", name, change[-1], file=out['out'])
-				print([name] + list(change[-1]), file=out['properties'])
-				errors.append((name, change))
-		print(file=out['out'])
-		print('-' * 79, file=out['out'])
-		print(file=out['short out'])
-		print('-' * 79, file=out['short out'])
+		with timing.stage('render'):
+			print("\nCategorised:", file=out['out'])
+			print("\nErrors:", file=out['short out'])
+			rename = {
+					'span mismatch': "Span Error",
+					'split': 'Conflated Entities',
+					'extra mention': 'Extra Mention',
+					'extra entity': 'Extra Entity', 'merge': 'Divided Entity',
+					'missing mention': 'Missing Mention',
+					'missing entity': 'Missing Entity',
+					'introduce': 'Introduced Mention',
+			}
+			for name in changes:
+				if len(changes[name]) > 0:
+					print(len(changes[name]), rename[name], file=out['out'])
+					print(len(changes[name]), rename[name],
+							file=out['short out'])
+			print('\nDetailed error listing:', file=out['out'])
+			for name in changes:
+				for change in changes[name]:
+					mention = None
+					if len(change[0]) == 1:
+						mention = change[0].copy().pop()
+					if mention is not None and 'out' in outputs:
+						print(name, end=' ', file=out['out'])
+						if mention in gold_mentions:
+							colour = 15
+							if gold_mentions[mention] in colours:
+								colour = colours[gold_mentions[mention]]
+							coreference_rendering.print_mention(
+									out['out'], False, gold_parses, gold_heads,
+									text, mention, colour)
+						else:
+							coreference_rendering.print_mention(out['out'],
+									False,
+									gold_parses,
+									gold_heads,
+									text,
+									mention,
+									extra=True)
+					print(name, change, file=out['out'])
+					print("Properties included:", name, change[-1],
+							file=out['out'])
+					print([name] + list(change[-1]), file=out['properties'])
+					errors.append((name, change))
+			print(file=out['out'])
+			print('-' * 79, file=out['out'])
+			print(file=out['short out'])
+			print('-' * 79, file=out['short out'])
+
+	# Print corrected output (auto_mentions has not changed since the span
+	# errors were fixed)
+	corrected = [
+			('error: span mismatch', auto_mentions),
+			('error: split', auto_mentions_split),
+			('error: extra mention', auto_mentions_extra_mention),
+			('error: extra entity', auto_mentions_extra_entity),
+			('error: merge', auto_mentions_merge),
+			('error: missing mention', auto_mentions_missing_mention),
+			('error: missing entity', auto_mentions_missing_entity),
+			('error: extra mention prog', auto_mentions_extra_mention_prog),
+			('error: extra entity prog', auto_mentions_extra_entity_prog),
+			('error: merge prog', auto_mentions_merge_prog),
+			('error: missing mention prog', auto_mentions_missing_mention_prog),
+			('error: missing entity prog', auto_mentions_missing_entity_prog),
+	]
+	with timing.stage('write'):
+		coreference_rendering.print_conll_style_parts([
+				(out[name], mentions) for name, mentions in corrected
+				if name in outputs
+		], text, doc_name, part_name)
+	if score:
+		with timing.stage('score'):
+			for name, mentions in corrected:
+				coreference_scoring.add_counts(scores[name],
+						coreference_scoring.score_part(gold_mentions, mentions))
+
+	timing.count('mention feature hits', features.hits)
+	timing.count('mention feature misses', features.misses)
+	return errors
 
-	# Print corrected output
-	coreference_rendering.print_conll_style_part(out['error: split'], text,
-			auto_mentions_split, doc_name,
-			part_name)
-	coreference_rendering.print_conll_style_part(out['error: extra mention'],
-			text,
-			auto_mentions_extra_mention,
-			doc_name, part_name)
-	coreference_rendering.print_conll_style_part(out['error: extra entity'],
-			text,
-			auto_mentions_extra_entity,
-			doc_name, part_name)
-	coreference_rendering.print_conll_style_part(out['error: merge'], text,
-			auto_mentions_merge, doc_name,
-			part_name)
-	coreference_rendering.print_conll_style_part(
-			out['error: missing mention'], text, auto_mentions_missing_mention,
-			doc_name, part_name)
-	coreference_rendering.print_conll_style_part(out['error: missing entity'],
-			text,
-			auto_mentions_missing_entity,
-			doc_name, part_name)
-	coreference_rendering.print_conll_style_part(
-			out['error: extra mention prog'], text,
-			auto_mentions_extra_mention_prog, doc_name, part_name)
-	coreference_rendering.print_conll_style_part(
-			out['error: extra entity prog'], text,
-			auto_mentions_extra_entity_prog, doc_name, part_name)
-	coreference_rendering.print_conll_style_part(out['error: merge prog'],
-			text,
-			auto_mentions_merge_prog,
-			doc_name, part_name)
-	coreference_rendering.print_conll_style_part(
-			out['error: missing mention prog'], text,
-			auto_mentions_missing_mention_prog, doc_name, part_name)
-	coreference_rendering.print_conll_style_part(
-			out['error: missing entity prog'], text,
-			auto_mentions_missing_entity_prog, doc_name, part_name)
 
-	return errors
+def print_impact(out, scores):
+	"""Print F-scores for each corrected version of the system output, and the
+	change in CoNLL score from the version it builds on."""
+	suffixes = dict(OUTPUT_FILES)
+	metrics = [('muc', 'MUC'), ('bcub', 'B3'), ('ceafm', 'CEAFm'),
+			('ceafe', 'CEAFe'), ('blanc', 'BLANC'), ('conll', 'CoNLL')]
+	results = {}
+	for name, _baseline in IMPACT_ROWS:
+		results[name] = coreference_scoring.scores(scores[name])
+	print('''# Each line below scores one corrected version of the system output
+# against the gold clusters (F1 for each metric).  'Change' is the increase
+# in the CoNLL score over the version named in brackets, i.e. the impact of
+# fixing that type of error.
+''', file=out)
+	print('{:<34}'.format('Corrected'), end='', file=out)
+	for _metric, label in metrics:
+		print('{:>8}'.format(label), end='', file=out)
+	print('   Change', file=out)
+	for name, baseline in IMPACT_ROWS:
+		print('{:<34}'.format(suffixes[name][1:]), end='', file=out)
+		for metric, _label in metrics:
+			print('{:8.2f}'.format(100 * results[name][metric][2]), end='',
+					file=out)
+		if baseline is not None:
+			change = results[name]['conll'][2] - results[baseline]['conll'][2]
+			print('   {:+.2f} ({})'.format(100 * change, suffixes[baseline][1:]),
+					end='', file=out)
+		print(file=out)
+
+	print('\nPrecision, recall and F1 for each metric:', file=out)
+	for name, _baseline in IMPACT_ROWS:
+		print('\n' + suffixes[name][1:], file=out)
+		for metric in coreference_scoring.METRICS + ['conll']:
+			print('  {:<10}'.format(metric), end='', file=out)
+			print(''.join('{:8.2f}'.format(100 * value)
+					for value in results[name][metric]), file=out)
+
+
+def process_document_buffered(job):
+	"""Run process_document on one part, keeping all output in memory.
+
+	Used for --jobs, where parts are handled by worker processes and the
+	parent writes the returned text for each output file in the usual order.
+	With --stats and --profile, the worker records timing and profile data
+	for just this part and returns them for the parent to merge."""
+	(doc_name, part_name, gold_doc, auto_doc, outputs, lang,
+			remove_singletons, stats, profile) = job
+	if stats:
+		recorder = timing.enable()
+	if profile is not None:
+		profiler = profiling.start(profile)
+	out = {}
+	for name, _suffix in OUTPUT_FILES:
+		if name in outputs:
+			out[name] = StringIO()
+		else:
+			out[name] = buffered_output.NullFile()
+	scores = None
+	if 'impact' in outputs:
+		scores = defaultdict(dict)
+	with timing.document(doc_name, part_name), timing.stage('process_document'):
+		errors = process_document(doc_name, part_name, gold_doc, auto_doc, out,
+				lang, remove_singletons, outputs, scores)
+	buffers = {name: out[name].getvalue() for name in outputs}
+	part_stats = None
+	if stats:
+		part_stats = recorder.as_dict()
+		timing.disable()
+	part_profile = None
+	if profile is not None:
+		profiler.stop()
+		part_profile = profiler.results()
+	return errors, buffers, scores, part_stats, part_profile
 
 
 def main():
+	"""Run the classification for the command line arguments.
+
+	Output files are closed even when the run stops with an error, so the
+	output for the parts handled before the error is kept, e.g. when the gold
+	file for a document is missing:
+
+	>>> import contextlib, gzip, io, os, shutil, tempfile
+	>>> directory = tempfile.mkdtemp()
+	>>> gold_dir = os.path.join(directory, 'gold')
+	>>> _ = shutil.copytree('data/gold', gold_dir,
+	... 		ignore=shutil.ignore_patterns('wsj_0089*'))
+	>>> prefix = os.path.join(directory, 'out')
+	>>> argv = sys.argv
+	>>> sys.argv = ['classify_coreference_errors.py', prefix, gold_dir,
+	... 		'data/homogenised/stanford.homogenised.out', '--compress=gz']
+	>>> with contextlib.redirect_stderr(io.StringIO()):
+	... 	main()
+	Traceback (most recent call last):
+	...
+	KeyError: '000'
+	>>> sys.argv = argv
+	>>> with gzip.open(prefix + '.classified.gz', 'rt') as source:
+	... 	'nw/wsj/00/wsj_0049' in source.read()
+	True
+	>>> shutil.rmtree(directory)
+	"""
 	# Process params
 	try:
 		opts, args = getopt.gnu_getopt(sys.argv[1:], '',
-				['keepsingletons', 'lang='])
+				['keepsingletons', 'lang=', 'jobs=', 'stream', 'cache=',
+				'cachesize=', 'compress=', 'outputs=', 'impact', 'stats=',
+				'profile=', 'goldindex=', 'documents='])
 		output_prefix, gold_dir, test_file = args
+		opts = dict(opts)
+		jobs = int(opts.get('--jobs', 1))
+		compression = opts.get('--compress')
+		if compression not in buffered_output.OPENERS:
+			raise ValueError(compression)
+		outputs = set(name for name, _suffix in OUTPUT_FILES
+				if name not in OPTIONAL_OUTPUTS)
+		if '--outputs' in opts:
+			outputs = buffered_output.select_outputs(opts['--outputs'],
+					OUTPUT_FILES)
+		if '--impact' in opts:
+			outputs.add('impact')
+		profile = opts.get('--profile')
+		if profile is not None and profile not in profiling.MODES:
+			raise ValueError(profile)
+		cache = conll_cache.from_options(opts)
 	except (getopt.GetoptError, ValueError):
 		print('Print coreference resolution errors')
 		print(('./%s <prefix> <gold_dir> <test_file> '
-				'[--keepsingletons] [--lang=<en|nl>]' % sys.argv[0]))
+				'[--keepsingletons] [--lang=<en|nl>] [--jobs=N] [--stream] '
+				'[--cache=<dir>] [--cachesize=<MB>] [--compress=<gz|xz>] '
+				'[--outputs=<suffix,...>] [--impact] [--stats=<file>] '
+				'[--profile=<cpu|mem>] [--goldindex=<file>] '
+				'[--documents=<pattern,...>]'
+				% sys.argv[0]))
 		return
-	opts = dict(opts)
+	if '--stats' in opts:
+		timing.enable()
+	profiler = None
+	if profile is not None:
+		profiler = profiling.start(profile)
 	remove_singletons = '--keepsingletons' not in opts
 	lang = opts.get('--lang', 'en')
-	# yapf: disable
-	out = {
-			'out': open(output_prefix + '.classified.detailed', 'w'),
-			'properties': open(output_prefix + '.classified.properties', 'w'),
-			'short out': open(output_prefix + '.classified', 'w'),
-			'summary': open(output_prefix + '.summary', 'w'),
-			'system output': open(output_prefix + '.system', 'w'),
-			'gold': open(output_prefix + '.gold', 'w'),
-			'error: original': open(output_prefix + '.corrected.none', 'w'),
-			'error: span mismatch':
-				open(output_prefix + '.corrected.span_errors', 'w'),
-			'error: split':
-				open(output_prefix + '.corrected.confused_entities', 'w'),
-			'error: extra mention':
-				open(output_prefix + '.corrected.extra_mention', 'w'),
-			'error: extra entity':
-				open(output_prefix + '.corrected.extra_entity', 'w'),
-			'error: merge':
-				open(output_prefix + '.corrected.divided', 'w'),
-			'error: missing mention':
-				open(output_prefix + '.corrected.missing_mention', 'w'),
-			'error: missing entity':
-				open(output_prefix + '.corrected.missing_entity', 'w'),
-			'error: extra mention prog':
-				open(output_prefix + '.corrected.extra_mention_prog', 'w'),
-			'error: extra entity prog':
-				open(output_prefix + '.corrected.extra_entity_prog', 'w'),
-			'error: merge prog':
-				open(output_prefix + '.corrected.divided_prog', 'w'),
-			'error: missing mention prog':
-				open(output_prefix + '.corrected.missing_mention_prog', 'w'),
-			'error: missing entity prog':
-				open(output_prefix + '.corrected.missing_entity_prog', 'w')
-	}
-	# yapf: enable
-
-	# Header info
-	init.header(sys.argv, out['out'])
-	init.header(sys.argv, out['short out'])
-	init.header(sys.argv, out['properties'])
-	init.header(sys.argv, out['summary'])
-	print('''# Each line below describes a single error.
-# The fields included for the seven error types are:
-# span mismatch
-#   System span (sentence, start, end)
-#   Gold span (sentence, start, end)
-#   Is the gold span a node in the gold parse?
-#   Extra text to left
-#   Missing text to left
-#   Extra text to right
-#   Missing text to right
-#   Nodes spanning extra text to left
-#   Nodes spanning missing text to left
-#   Nodes spanning extra text to right
-#   Nodes spanning missing text to right
-#
-# missing and extra entity
-#   Missing or extra
-#   Size
-#   Number of proper names
-#   Number of nominals
-#   Number of pronouns
-#   If it is 1 pronoun and 1 nominal/name, the pronoun
-#   Number of cataphoric pronouns
-#   NER types assigned to mentions in this cluster
-#   Is there an exact string match for all mentions?
-#   Is there a head match for all mentions?
-#
-# extra and missing mentions
-#   Missing or extra
-#   Mention type
-#   The mention
-#   Is there an exact match with something in the cluster?
-#   Is there a head match with something in the cluster?
-#   Is this a nested mention?
-#   Was this the first mention in the cluster?
-#   Was this the last mention in the cluster?
-#   Was this a case of cataphoa?
-#   Does NER match?
-#   Does number match?
-#   Does person match?
-#   Does gender match?
-#
-# split and merge (conflated entities and divided entity)
-#   Split or merge
-#   Size of the part being split/merged ('part' for the rest of these notes)
-#   Size of the rest of the cluster ('rest' for the rest of these notes)
-#   If the part is a single mention, its text
-#   The number of cataphoric pronouns in the part
-#   Number of names in the part
-#   Number of nominals in the part
-#   Number of pronouns in the part
-#   Number of names in the rest
-#   Number of nominals in the rest
-#   Number of pronouns in the rest
-#   Whether the mentions in the part are extra
-#   Whether the rest is made up of extra mentions
-#   Is there an exact string match between a mention in the part and one in the rest?
-#   Is there a head match between a mention in the part and one in the rest?
-#   Will this part be merged or deleted later?
-#   Has this part been split or introduced earlier?
-#   NER type(s) of part and rest match
-#   NER types of the part
-#   NER types of the rest
-#   Number type(s) of part and rest match
-#   Number types of the part
-#   Number types of the rest
-#   Gender type(s) of part and rest match
-#   Gender types of the part
-#   Gender types of the rest
-#   Person type(s) of part and rest match
-#   Person types of the part
-#   Person types of the rest
-''', file=out['properties'])
-
-	# Read input
-	auto = coreference_reading.read_conll_coref_system_output(test_file)
-	gold = coreference_reading.read_conll_matching_files(auto, gold_dir, lang)
-
-	# Define an order
-	order = []
-	for doc in auto:
-		for part in auto[doc]:
-			order.append((doc, part))
-	order.sort()
-
-	# Work out the errors
-	counts = defaultdict(lambda: [])
-	for doc, part in order:
-		if doc not in gold or part not in gold[doc]:
-			print(doc, part, "not in gold", file=sys.stderr)
-		if 'text' not in auto[doc][part]:
-			auto[doc][part]['text'] = gold[doc][part]['text']
-		errors = process_document(doc, part, gold[doc][part], auto[doc][part],
-				out, lang, remove_singletons)
-		for error in errors:
-			counts[error[0]].append(error)
-
-	# Print a summary of the changes and errors
-	order = [(None, "Operations:"), ('span mismatch', 'Correct Span'),
-			('raw introduce', 'Introduce Mention'),
-			('raw split', 'Split from Cluster'),
-			('raw merge', 'Merge into Cluster'),
-			('raw remove', 'Remove Mention'), (None, ''), (None, 'Errors:'),
-			('span mismatch', "Span Error"), (None, ''),
-			('split', 'Conflated Entities'),
-			('extra mention', 'Extra Mention'),
-			('extra entity', 'Extra Entity'), (None, ''),
-			('merge', 'Divided Entity'),
-			('missing mention', 'Missing Mention'),
-			('missing entity', 'Missing Entity')]
-	for key, text in order:
-		if key is None:
-			print(text, file=out['summary'])
+	writer = buffered_output.OutputWriter(compression)
+	out = {}
+	try:
+		for name, suffix in OUTPUT_FILES:
+			if name in outputs:
+				out[name] = writer.open(output_prefix + suffix)
+			else:
+				out[name] = buffered_output.NullFile()
+
+		# Header info
+		init.header(sys.argv, out['out'])
+		init.header(sys.argv, out['short out'])
+		init.header(sys.argv, out['properties'])
+		init.header(sys.argv, out['summary'])
+		init.header(sys.argv, out['impact'])
+		print(PROPERTIES_HEADER, file=out['properties'])
+
+		# Read input
+		if '--goldindex' in opts:
+			gold_manifest.for_directory(gold_dir, opts['--goldindex'])
+		# Only read the parts for the selected documents
+		select = None
+		if '--documents' in opts:
+			select = conll_index.document_filter(opts['--documents'])
+		if '--stream' in opts:
+			# Pair parts up as they are read, rather than loading everything
+			system_parts = (
+					coreference_reading.generate_conll_coref_system_output(
+					test_file, select))
+			parts = coreference_reading.generate_conll_matching_parts(
+					system_parts, gold_dir, lang, cache)
 		else:
-			print("%6d   %s" % (len(counts[key]), text), file=out['summary'])
+			with timing.stage('read'):
+				auto = coreference_reading.read_conll_coref_system_output(
+						test_file, select=select)
+				gold = coreference_reading.read_conll_matching_files(auto,
+						gold_dir, lang, cache, select is not None)
+			parts = coreference_reading.sorted_matching_parts(auto, gold)
+		if timing.enabled():
+			parts = timing.timed('read', parts)
 
-	for name in out:
-		out[name].close()
+		# Work out the errors
+		counts = defaultdict(lambda: [])
+		# Only score the corrected outputs for the impact table
+		scores = None
+		if 'impact' in outputs:
+			scores = defaultdict(dict)
+		if jobs > 1:
+			tasks = ((doc, part, gold_doc, auto_doc, outputs, lang,
+					remove_singletons, timing.enabled(), profile)
+					for doc, part, gold_doc, auto_doc in parts)
+			# Pool.imap consumes its input eagerly, so keep a bounded window of
+			# tasks in flight instead, submitting a new one as each result is
+			# taken.  Results are taken in task order, so the output files are
+			# the same as for a serial run.
+			pool = multiprocessing.Pool(jobs, profiling.worker_init)
+			pending = deque()
+			for task in itertools.islice(tasks, jobs * 4):
+				pending.append(pool.apply_async(process_document_buffered,
+						(task,)))
+			while len(pending) > 0:
+				(errors, buffers, part_scores, stats,
+						part_profile) = pending.popleft().get()
+				for task in itertools.islice(tasks, 1):
+					pending.append(pool.apply_async(process_document_buffered,
+							(task,)))
+				with timing.stage('write'):
+					for name in buffers:
+						out[name].write(buffers[name])
+				if stats is not None:
+					timing.recorder().merge(stats)
+				if part_profile is not None:
+					profiler.merge(part_profile)
+				for error in errors:
+					counts[error[0]].append(error)
+				if part_scores is not None:
+					for name in part_scores:
+						coreference_scoring.add_counts(scores[name],
+								part_scores[name])
+			pool.close()
+			pool.join()
+		else:
+			for doc, part, gold_doc, auto_doc in parts:
+				with timing.document(doc, part), timing.stage(
+						'process_document'):
+					errors = process_document(doc, part, gold_doc, auto_doc,
+							out, lang, remove_singletons, outputs, scores)
+				for error in errors:
+					counts[error[0]].append(error)
+
+		# Print a summary of the changes and errors
+		order = [(None, "Operations:"), ('span mismatch', 'Correct Span'),
+				('raw introduce', 'Introduce Mention'),
+				('raw split', 'Split from Cluster'),
+				('raw merge', 'Merge into Cluster'),
+				('raw remove', 'Remove Mention'), (None, ''), (None, 'Errors:'),
+				('span mismatch', "Span Error"), (None, ''),
+				('split', 'Conflated Entities'),
+				('extra mention', 'Extra Mention'),
+				('extra entity', 'Extra Entity'), (None, ''),
+				('merge', 'Divided Entity'),
+				('missing mention', 'Missing Mention'),
+				('missing entity', 'Missing Entity')]
+		for key, text in order:
+			if key is None:
+				print(text, file=out['summary'])
+			else:
+				print("%6d   %s" % (len(counts[key]), text),
+						file=out['summary'])
+
+		if 'impact' in outputs:
+			with timing.stage('score'):
+				print_impact(out['impact'], scores)
+
+	finally:
+		# Close the files even if the run stops partway, so everything
+		# written so far is kept
+		with timing.stage('write'):
+			for name in out:
+				out[name].close()
+			writer.close()
+	if '--stats' in opts:
+		timing.write(opts['--stats'])
+	if profiler is not None:
+		profiler.stop()
+		profiler.write(output_prefix)
 
 
 if __name__ == '__main__':
@@ -17,7 +17,8 @@ import sys
 import glob
 import getopt
 from collections import defaultdict
-from nlp_util import init, coreference_reading, coreference_rendering
+from nlp_util import (init, coreference_reading, coreference_rendering,
+		timing, profiling, gold_manifest)
 
 
 def convert_underscored_filename(filename):
@@ -126,31 +127,54 @@ def main():
 			'uiuc': read_uiuc,
 	}
 	try:
-		_opts, args = getopt.gnu_getopt(sys.argv[1:], '', [])
+		opts, args = getopt.gnu_getopt(sys.argv[1:], '',
+				['stats=', 'profile=', 'goldindex='])
 		output_prefix, fmt, auto_src, gold_src = args
+		opts = dict(opts)
+		profile = opts.get('--profile')
+		if profile is not None and profile not in profiling.MODES:
+			raise ValueError(profile)
 	except (getopt.GetoptError, ValueError):
 		print('Translate a system output into the CoNLL format')
-		print('./%s <prefix> <[%s]> <dir | file> <gold dir>'
+		print('./%s <prefix> <[%s]> <dir | file> <gold dir> [--stats=<file>] '
+				'[--profile=<cpu|mem>] [--goldindex=<file>]'
 				% (sys.argv[0], ','.join(formats)))
 		return
 	if fmt not in formats:
 		print("Invalid format.  Valid options are:")
 		print('\n'.join(formats))
 		return
+	if '--stats' in opts:
+		timing.enable()
+	profiler = None
+	if profile is not None:
+		profiler = profiling.start(profile)
+	if '--goldindex' in opts:
+		gold_manifest.for_directory(gold_src, opts['--goldindex'])
 
 	with open(output_prefix + '.out', 'w') as out:
 		with open(output_prefix + '.log', 'w') as log:
 			init.header(sys.argv, log)
-			auto, gold = formats[fmt](auto_src, gold_src)
+			with timing.stage('read'):
+				auto, gold = formats[fmt](auto_src, gold_src)
 			for doc in auto:
 				for part in auto[doc]:
+					timing.count('documents')
+					timing.count('system mentions',
+							len(auto[doc][part]['mentions']))
 					for mention in auto[doc][part]['mentions']:
 						if mention[1] >= mention[2]:
 							info = "Invalid mention span {} from {} {}".format(
 									str(mention), doc, part)
 							info += '\n' + gold[doc][part]['text'][mention[0]]
 							raise Exception(info)
-			coreference_rendering.print_conll_style(auto, gold, out)
+			with timing.stage('write'):
+				coreference_rendering.print_conll_style(auto, gold, out)
+	if '--stats' in opts:
+		timing.write(opts['--stats'])
+	if profiler is not None:
+		profiler.stop()
+		profiler.write(output_prefix)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+"""Buffered output files written from a background thread.
+
+Writes to each file are collected in memory and handed over in large chunks
+to a single writer thread, so formatting in the main thread overlaps with
+disk I/O (and compression, when it is used).  The files returned by
+OutputWriter.open support write, flush and close, so they can be used with
+print(..., file=f).
+
+>>> import os, tempfile
+>>> directory = tempfile.mkdtemp()
+>>> writer = OutputWriter('gz')
+>>> out = writer.open(os.path.join(directory, 'example'))
+>>> print('some output', file=out)
+>>> out.close()
+>>> writer.close()
+>>> import gzip
+>>> with gzip.open(os.path.join(directory, 'example.gz'), 'rt') as src:
+... 	print(src.read().strip())
+some output
+"""
+from __future__ import print_function, absolute_import
+import gzip
+import lzma
+import threading
+import queue
+
+CHUNK_SIZE = 1024 * 1024  # characters
+MAX_PENDING = 16  # chunks waiting for the writer thread
+
+# compression -> (filename suffix, function to open the file)
+OPENERS = {
+		None: ('', open),
+		'gz': ('.gz', gzip.open),
+		'xz': ('.xz', lzma.open),
+}
+
+
+class OutputWriter:
+	"""A writer thread shared by a set of output files."""
+
+	def __init__(self, compression=None, chunk_size=CHUNK_SIZE):
+		if compression not in OPENERS:
+			raise ValueError("Unknown compression: %s" % compression)
+		self.compression = compression
+		self.chunk_size = chunk_size
+		self.pending = queue.Queue(MAX_PENDING)
+		self.error = None
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def open(self, filename):
+		suffix, opener = OPENERS[self.compression]
+		return BufferedFile(self, opener(filename + suffix, 'wt'))
+
+	def submit(self, handle, text):
+		"""Queue text to be written to handle, or None to close it."""
+		if self.error is not None:
+			raise self.error
+		self.pending.put((handle, text))
+
+	def run(self):
+		while True:
+			item = self.pending.get()
+			if item is None:
+				break
+			handle, text = item
+			try:
+				if text is None:
+					handle.close()
+				else:
+					handle.write(text)
+			except Exception as error:
+				if self.error is None:
+					self.error = error
+
+	def close(self):
+		"""Wait for everything submitted so far to be written."""
+		self.pending.put(None)
+		self.thread.join()
+		if self.error is not None:
+			raise self.error
+
+
+class BufferedFile:
+	def __init__(self, writer, handle):
+		self.writer = writer
+		self.handle = handle
+		self.parts = []
+		self.size = 0
+
+	def write(self, text):
+		self.parts.append(text)
+		self.size += len(text)
+		if self.size >= self.writer.chunk_size:
+			self.flush()
+		return len(text)
+
+	def flush(self):
+		if len(self.parts) > 0:
+			self.writer.submit(self.handle, ''.join(self.parts))
+			self.parts = []
+			self.size = 0
+
+	def close(self):
+		self.flush()
+		self.writer.submit(self.handle, None)
+
+
+class NullFile:
+	"""Stands in for an output file that was not requested."""
+
+	def write(self, text):
+		return len(text)
+
+	def flush(self):
+		pass
+
+	def close(self):
+		pass
+
+
+def select_outputs(spec, files):
+	"""Work out which of a list of (name, filename suffix) pairs to write.
+
+	spec is a comma separated list of suffixes, without the leading '.'.  An
+	entry that is not a suffix itself selects every suffix that starts with it,
+	e.g. 'corrected' covers '.corrected.none', '.corrected.divided', etc.
+
+	>>> files = [('a', '.classified'), ('b', '.classified.detailed'),
+	... 		('c', '.corrected.none'), ('d', '.corrected.divided')]
+	>>> sorted(select_outputs('classified,corrected', files))
+	['a', 'c', 'd']
+	>>> select_outputs('nothing', files)
+	Traceback (most recent call last):
+	...
+	ValueError: Unknown output: nothing
+	"""
+	selected = set()
+	for entry in spec.split(','):
+		entry = entry.strip()
+		matches = [name for name, suffix in files if suffix == '.' + entry]
+		if len(matches) == 0:
+			matches = [name for name, suffix in files
+					if suffix.startswith('.' + entry + '.')]
+		if len(entry) == 0 or len(matches) == 0:
+			raise ValueError("Unknown output: %s" % entry)
+		selected.update(matches)
+	return selected
@@ -0,0 +1,112 @@
+"""Cluster alignment for CEAF (Luo, 2005).
+
+CEAF scores the best one-to-one alignment between gold and system clusters.
+Only clusters that share a mention have a non-zero similarity, and those are
+exactly the links followed by coreference.confusion_groups, so each confusion
+group can be aligned on its own.  Most groups have one or two clusters on each
+side, so this avoids solving one large assignment problem per document.
+
+>>> groups = [([{'a', 'b', 'c'}], [{'a', 'b'}, {'c'}]), ([{'d'}], [{'d'}])]
+>>> alignment(groups, mention_similarity)
+3
+>>> round(alignment(groups, entity_similarity), 3)
+1.8
+"""
+from __future__ import print_function, absolute_import
+
+
+def mention_similarity(gold, auto):
+	"""phi_3, used for CEAF-m."""
+	return len(gold & auto)
+
+
+def entity_similarity(gold, auto):
+	"""phi_4, used for CEAF-e."""
+	return 2.0 * len(gold & auto) / (len(gold) + len(auto))
+
+
+def max_assignment(weights, columns):
+	"""Total weight of the best one-to-one assignment of rows to columns.
+
+	weights is a list of rows, each a map from column numbers (in
+	range(columns)) to weights.  Missing entries have weight 0.  This is the
+	Hungarian algorithm, with rows added one at a time, O(rows^2 columns).
+
+	>>> max_assignment([{0: 3, 1: 2}, {0: 3}], 2)
+	5
+	>>> max_assignment([{0: 1}, {0: 2}, {0: 1}], 2)
+	2
+	"""
+	# Solve the minimisation version, on a square problem padded with zeros
+	size = max(len(weights), columns)
+	cost = [[-row.get(j, 0) for j in range(size)] for row in weights]
+	cost += [[0] * size for _ in range(size - len(weights))]
+	inf = float('inf')
+	u = [0] * (size + 1)
+	v = [0] * (size + 1)
+	match = [0] * (size + 1)  # column -> row, both numbered from 1
+	way = [0] * (size + 1)
+	for i in range(1, size + 1):
+		match[0] = i
+		j0 = 0
+		minv = [inf] * (size + 1)
+		used = [False] * (size + 1)
+		while True:
+			used[j0] = True
+			i0 = match[j0]
+			delta = inf
+			j1 = 0
+			row = cost[i0 - 1]
+			for j in range(1, size + 1):
+				if not used[j]:
+					cur = row[j - 1] - u[i0] - v[j]
+					if cur < minv[j]:
+						minv[j] = cur
+						way[j] = j0
+					if minv[j] < delta:
+						delta = minv[j]
+						j1 = j
+			for j in range(size + 1):
+				if used[j]:
+					u[match[j]] += delta
+					v[j] -= delta
+				else:
+					minv[j] -= delta
+			j0 = j1
+			if match[j0] == 0:
+				break
+		while True:
+			j1 = way[j0]
+			match[j0] = match[j1]
+			j0 = j1
+			if j0 == 0:
+				break
+	total = 0
+	for j in range(1, size + 1):
+		if match[j] <= len(weights):
+			total += weights[match[j] - 1].get(j - 1, 0)
+	return total
+
+
+def group_alignment(gold, auto, similarity):
+	"""Best total similarity for one confusion group, given as lists of sets."""
+	if len(gold) == 0 or len(auto) == 0:
+		return 0
+	weights = []
+	for gcluster in gold:
+		row = {}
+		for i, acluster in enumerate(auto):
+			if not gcluster.isdisjoint(acluster):
+				row[i] = similarity(gcluster, acluster)
+		weights.append(row)
+	# With a single cluster on one side only one pair can be aligned
+	if len(gold) == 1:
+		return max(weights[0].values())
+	if len(auto) == 1:
+		return max(row[0] for row in weights)
+	return max_assignment(weights, len(auto))
+
+
+def alignment(groups, similarity):
+	"""Best total similarity over all (auto, gold) confusion groups."""
+	return sum(group_alignment(gold, auto, similarity) for auto, gold in groups)
@@ -0,0 +1,248 @@
+"""On-disk cache of parsed CoNLL files.
+
+Gold data does not change between runs, so the result of reading a gold file
+(text, NER, mentions, trees and head maps) can be stored and reused instead of
+parsing every sentence again.  Entries are keyed on the absolute path of the
+file, the language and the set of fields requested, and are invalidated when
+the modification time or size of the file changes.  When the cache grows past
+its size limit the least recently used entries are removed.
+
+An entry holds a header, then each part of the file pickled separately, so
+parts are written and loaded one at a time and only the current part needs to
+be in memory (e.g. with --stream)."""
+from __future__ import print_function, absolute_import
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+import time
+from nlp_util import pstree, coreference_reading
+
+CACHE_VERSION = 2
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # bytes
+ENTRY_SUFFIX = '.pickle'
+
+
+def compact_info(info):
+	"""Replace parse trees with the compact form from pstree.tree_to_tuples.
+	Lazily built parses and heads are built in full, so loading an entry does
+	not need to parse anything."""
+	ans = dict(info)
+	if 'parses' in ans:
+		ans['parses'] = [pstree.tree_to_tuples(tree) for tree in ans['parses']]
+	if 'heads' in ans:
+		ans['heads'] = list(ans['heads'])
+	return ans
+
+
+def expand_info(info):
+	"""Inverse of compact_info."""
+	if 'parses' in info:
+		info['parses'] = coreference_reading.LazyParses(info['parses'],
+				pstree.tree_from_tuples)
+	return info
+
+
+def from_options(opts):
+	"""The cache for the --cache=<dir> and --cachesize=<MB> options of the
+	scripts, or None if there is no --cache.  Raises ValueError if the size is
+	not a whole number of MB.
+
+	>>> from_options({}) is None
+	True
+	>>> from_options({'--cache': 'unused', '--cachesize': 'lots'})
+	Traceback (most recent call last):
+	...
+	ValueError: Invalid cache size: lots
+	"""
+	max_size = DEFAULT_MAX_SIZE
+	if '--cachesize' in opts:
+		value = opts['--cachesize']
+		if not value.isdigit():
+			raise ValueError("Invalid cache size: %s" % value)
+		max_size = int(value) * 1024 * 1024
+	if '--cache' not in opts:
+		return None
+	return ConllCache(opts['--cache'], max_size)
+
+
+class ConllCache:
+	"""A directory of pickled, parsed CoNLL files.
+
+	When the entries take up more than max_size bytes the least recently used
+	are removed:
+	>>> import shutil, tempfile
+	>>> directory = tempfile.mkdtemp()
+	>>> names = []
+	>>> for name in 'abc':
+	... 	names.append(os.path.join(directory, name + '.conll'))
+	... 	with open(names[-1], 'w') as out:
+	... 		_ = out.write(name)
+	>>> cache = ConllCache(os.path.join(directory, 'cache'))
+	>>> parts = [('doc', '000', {'text': [['word']]})]
+	>>> cache.store(names[0], None, parts)
+	>>> cache.max_size = cache.total * 2
+	>>> cache.store(names[1], None, parts)
+	>>> list(cache.load(names[0], None)) == parts
+	True
+	>>> cache.store(names[2], None, parts)
+	>>> [cache.load(name, None) is not None for name in names]
+	[True, False, True]
+	>>> shutil.rmtree(directory)
+	"""
+
+	def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+		self.directory = directory
+		self.max_size = max_size
+		# {path: [last used, size]} for the entries, from one scan of the
+		# directory (see known_entries), and their total size
+		self.entries = None
+		self.total = 0
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+	def known_entries(self):
+		"""The entries in the directory, listed once per run and then kept up
+		to date as entries are stored, used and removed, so adding an entry
+		does not need to look at all the others."""
+		if self.entries is None:
+			self.entries = {}
+			self.total = 0
+			for name in os.listdir(self.directory):
+				if not name.endswith(ENTRY_SUFFIX):
+					continue
+				path = os.path.join(self.directory, name)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				self.entries[path] = [stat.st_mtime, stat.st_size]
+				self.total += stat.st_size
+		return self.entries
+
+	def entry_path(self, filename, key):
+		name = repr((os.path.abspath(filename), key))
+		digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+		return os.path.join(self.directory, digest + ENTRY_SUFFIX)
+
+	def load(self, filename, key):
+		"""Return an iterator over the (doc, part, info) stored for this file,
+		or None if there is no valid entry."""
+		path = self.entry_path(filename, key)
+		if not os.path.exists(path):
+			return None
+		stat = os.stat(filename)
+		try:
+			cache_file = open(path, 'rb')
+		except OSError:
+			return None
+		try:
+			header = pickle.load(cache_file)
+		except Exception:
+			header = None
+		if (not isinstance(header, dict)
+				or header.get('version') != CACHE_VERSION
+				or header['mtime'] != stat.st_mtime_ns
+				or header['size'] != stat.st_size):
+			# Stale or unreadable
+			cache_file.close()
+			self.remove(path)
+			return None
+		# Mark as recently used
+		os.utime(path, None)
+		if self.entries is not None and path in self.entries:
+			self.entries[path][0] = time.time()
+		return self.read_parts(cache_file)
+
+	def read_parts(self, cache_file):
+		with cache_file:
+			while True:
+				item = pickle.load(cache_file)
+				# The end of the entry
+				if item is None:
+					return
+				doc, part, info = item
+				yield doc, part, expand_info(info)
+
+	def write_through(self, filename, key, parts):
+		"""Save the (doc, part, info) read from this file, yielding each one
+		as it is written.  The entry is only kept if every part is written,
+		i.e. if this is run to the end."""
+		stat = os.stat(filename)
+		header = {
+				'version': CACHE_VERSION,
+				'mtime': stat.st_mtime_ns,
+				'size': stat.st_size,
+		}
+		path = self.entry_path(filename, key)
+		# Write to a temporary file first so readers never see partial entries
+		handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+		cache_file = os.fdopen(handle, 'wb')
+		try:
+			try:
+				pickle.dump(header, cache_file, pickle.HIGHEST_PROTOCOL)
+			except Exception as error:
+				cache_file = self.write_failed(path, cache_file, error)
+			for doc, part, info in parts:
+				if cache_file is not None:
+					try:
+						pickle.dump((doc, part, compact_info(info)), cache_file,
+								pickle.HIGHEST_PROTOCOL)
+					except Exception as error:
+						cache_file = self.write_failed(path, cache_file, error)
+				yield doc, part, info
+			if cache_file is None:
+				return
+			try:
+				pickle.dump(None, cache_file, pickle.HIGHEST_PROTOCOL)
+				size = cache_file.tell()
+				cache_file.close()
+				entries = self.known_entries()
+				os.replace(tmp_path, path)
+			except Exception as error:
+				cache_file = self.write_failed(path, cache_file, error)
+				return
+		finally:
+			if cache_file is not None and not cache_file.closed:
+				cache_file.close()
+			if os.path.exists(tmp_path):
+				self.remove(tmp_path)
+		if path in entries:
+			self.total -= entries[path][1]
+		entries[path] = [time.time(), size]
+		self.total += size
+		if self.total > self.max_size:
+			self.evict()
+
+	def write_failed(self, path, cache_file, error):
+		print("Unable to write cache entry", path, error, file=sys.stderr)
+		cache_file.close()
+		return None
+
+	def store(self, filename, key, parts):
+		"""Save the list of (doc, part, info) read from this file."""
+		for _item in self.write_through(filename, key, parts):
+			pass
+
+	def remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+		if self.entries is not None and path in self.entries:
+			self.total -= self.entries.pop(path)[1]
+
+	def evict(self):
+		"""Delete least recently used entries until the cache fits in
+		max_size bytes."""
+		entries = self.known_entries()
+		for _used, path in sorted((entries[path][0], path) for path in entries):
+			if self.total <= self.max_size:
+				break
+			self.remove(path)
+
+	def clear(self):
+		for name in os.listdir(self.directory):
+			if name.endswith(ENTRY_SUFFIX):
+				self.remove(os.path.join(self.directory, name))
@@ -0,0 +1,124 @@
+"""Byte offsets of the parts of a CoNLL file, for reading only some of them.
+
+The index maps (doc, part) to the (offset, length) of the block from its
+#begin document line to its #end document line.  It is saved as JSON next to
+the file (<file>.index) and rebuilt when the modification time or size of the
+file changes.  If it cannot be saved (e.g. the directory is read-only) it is
+kept in memory for the run.
+
+>>> import os, tempfile
+>>> directory = tempfile.mkdtemp()
+>>> filename = os.path.join(directory, 'test.conll')
+>>> with open(filename, 'w') as out:
+... 	for doc in ['a', 'b']:
+... 		_ = out.write('#begin document (%s); part 000\\n' % doc)
+... 		_ = out.write('%s 0 0 word -\\n\\n#end document\\n' % doc)
+>>> index = load_index(filename)
+>>> index[('b', '000')]
+(58, 58)
+>>> os.path.exists(filename + INDEX_SUFFIX)
+True
+>>> for line in selected_lines(filename, lambda doc, part: doc == 'b'):
+... 	print(line.strip())
+#begin document (b); part 000
+b 0 0 word -
+<BLANKLINE>
+#end document
+>>> import shutil
+>>> shutil.rmtree(directory)
+"""
+from __future__ import print_function, absolute_import
+import io
+import os
+import json
+import fnmatch
+import locale
+from nlp_util import gold_manifest
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.index'
+
+_indexes = {}
+
+
+def part_keys(line):
+	"""The (doc, part) for a #begin document line."""
+	desc = line.split()
+	location = desc[2].strip('();')
+	return gold_manifest.gold_document_name(location), desc[-1]
+
+
+def build_index(filename):
+	"""Scan the file, returning a list of [doc, part, offset, length]."""
+	ans = []
+	offset = 0
+	start = None
+	keys = None
+	with open(filename, 'rb') as source:
+		for line in source:
+			if line.startswith(b'#begin'):
+				start = offset
+				keys = part_keys(line.decode('utf-8', 'replace'))
+			offset += len(line)
+			if line.startswith(b'#end') and keys is not None:
+				ans.append([keys[0], keys[1], start, offset - start])
+				keys = None
+	return ans
+
+
+def load_index(filename):
+	"""The index for a file as a dict, from the saved copy if it is current."""
+	stat = os.stat(filename)
+	stamp = (stat.st_mtime_ns, stat.st_size)
+	if filename in _indexes and _indexes[filename][0] == stamp:
+		return _indexes[filename][1]
+	path = filename + INDEX_SUFFIX
+	entries = None
+	try:
+		with open(path) as source:
+			saved = json.load(source)
+		if (saved['version'] == INDEX_VERSION and saved['mtime'] == stamp[0]
+				and saved['size'] == stamp[1]):
+			entries = saved['parts']
+	except (OSError, ValueError, KeyError):
+		pass
+	if entries is None:
+		entries = build_index(filename)
+		try:
+			with open(path, 'w') as out:
+				json.dump({'version': INDEX_VERSION, 'mtime': stamp[0],
+						'size': stamp[1], 'parts': entries}, out)
+		except OSError:
+			pass
+	index = {}
+	for doc, part, offset, length in entries:
+		index[doc, part] = (offset, length)
+	_indexes[filename] = (stamp, index)
+	return index
+
+
+def selected_lines(filename, select):
+	"""Yield the lines of the parts for which select(doc, part) is true, in
+	file order, seeking past the others."""
+	index = load_index(filename)
+	blocks = sorted(index[key] for key in index if select(*key))
+	encoding = locale.getpreferredencoding(False)
+	with open(filename, 'rb') as source:
+		for offset, length in blocks:
+			source.seek(offset)
+			text = source.read(length).decode(encoding)
+			for line in io.StringIO(text, newline=None):
+				yield line
+
+
+def document_filter(spec):
+	"""A select function for selected_lines that accepts documents matching
+	any of a comma-separated list of glob patterns.
+
+	>>> select = document_filter('nw/wsj/*,bc/cnn/00/cnn_0001')
+	>>> select('nw/wsj/00/wsj_0020', '000'), select('bc/cnn/00/cnn_0002', '000')
+	(True, False)
+	"""
+	patterns = spec.split(',')
+	return lambda doc, part: any(fnmatch.fnmatchcase(doc, pattern)
+			for pattern in patterns)
@@ -3,7 +3,9 @@ import re
 import sys
 from collections import defaultdict
 import string
+import itertools
 from nlp_util import head_finder
+from nlp_util import coreference_reading
 
 # TODO: Look into semantic head finding (current is syntactically biased)
 
@@ -57,10 +59,12 @@ def confusion_groups(gold_mentions, auto_mentions, gold_clusters,
 
 def mention_head(mention, text, parses, heads, default_last=True):
 	sentence, start, end = mention
-	node = parses[sentence].get_nodes('lowest', start, end)
+	node = coreference_reading.get_nodes(parses, sentence, 'lowest', start,
+			end)
 	if node is None:
 		if default_last:
-			node = parses[sentence].get_nodes('lowest', end - 1, end)
+			node = coreference_reading.get_nodes(parses, sentence, 'lowest',
+					end - 1, end)
 		else:
 			return None
 	return head_finder.get_head(heads[sentence], node)
@@ -95,6 +99,309 @@ def mention_text(mention, text):
 	return ' '.join(ans)
 
 
+def trim_mention(mention, text):
+	"""Remove a leading 'the', a trailing "'s" and punctuation from either end
+	of the mention, keeping at least one word.
+
+	>>> text = [['Yesterday', ',', 'the', 'company', "'s", 'shares', 'fell']]
+	>>> trim_mention((0, 1, 5), text)
+	(0, 3, 4)
+	>>> trim_mention((0, 1, 2), text)
+	(0, 1, 2)
+	"""
+	sentence, start, end = mention
+	words = text[sentence]
+	while (start < end - 1
+			and (words[start] == "the"
+				or (len(words[start]) == 1
+					and words[start][0] not in string.ascii_letters))):
+		start += 1
+	while (start < end - 1
+			and (words[end - 1] == "'s"
+				or (len(words[end - 1]) == 1
+					and words[end - 1][0] not in string.ascii_letters))):
+		end -= 1
+	return (sentence, start, end)
+
+
+def match_trimmed_mentions(gold_mentions, auto_mentions, text):
+	"""Map auto mentions to gold mentions that are the same once trimmed (see
+	trim_mention).  When several gold mentions match an auto mention the last
+	one (in the order given) is used, and all of them stop being candidates for
+	later auto mentions.
+
+	>>> text = [['the', 'company', "'s", 'shares', 'fell', '.']]
+	>>> match_trimmed_mentions([(0, 0, 3), (0, 3, 4)], [(0, 1, 2), (0, 3, 5)],
+	... 		text)
+	{(0, 1, 2): (0, 0, 3)}
+	>>> match_trimmed_mentions([(0, 0, 2), (0, 1, 3)], [(0, 1, 2), (0, 0, 3)],
+	... 		text)
+	{(0, 1, 2): (0, 1, 3)}
+	"""
+	candidates = defaultdict(list)
+	for gmention in gold_mentions:
+		candidates[trim_mention(gmention, text)].append(gmention)
+	mapping = {}
+	for amention in auto_mentions:
+		bucket = candidates.pop(trim_mention(amention, text), None)
+		if bucket:
+			mapping[amention] = bucket[-1]
+	return mapping
+
+
+class MentionFeatures:
+	"""Per-document store of mention properties.
+
+	Error classification asks for the type, head, text and pronoun properties
+	of the same mentions many times over, so each is computed once per mention
+	and kept.  hits and misses count lookups that were and were not already
+	stored.
+
+	>>> from nlp_util.pstree import tree_from_text
+	>>> parse = tree_from_text("(ROOT (S (NP (PRP He)) (VP (VBD saw) (NP (NNP Haag)))))")
+	>>> heads = head_finder.collins_find_heads(parse)
+	>>> features = MentionFeatures([['He', 'saw', 'Haag']], [parse], [heads], 'en')
+	>>> features.mention_type((0, 0, 1)), features.mention_type((0, 2, 3))
+	('pronoun', 'name')
+	>>> features.pronoun_properties((0, 0, 1))
+	('male', 'single', 'third')
+	>>> features.mention_type((0, 0, 1))
+	'pronoun'
+	>>> features.hits, features.misses
+	(1, 3)
+	"""
+
+	def __init__(self, text, parses, heads, lang):
+		self.text = text
+		self.parses = parses
+		self.heads = heads
+		self.lang = lang
+		self.types = {}
+		self.mention_heads = {}
+		self.texts = {}
+		self.pronouns = {}
+		self.hits = 0
+		self.misses = 0
+
+	def mention_type(self, mention):
+		if mention in self.types:
+			self.hits += 1
+		else:
+			self.misses += 1
+			self.types[mention] = mention_type(mention, self.text, self.parses,
+					self.heads, self.lang)
+		return self.types[mention]
+
+	def mention_head(self, mention):
+		"""As for mention_head, defaulting to the last word."""
+		if mention in self.mention_heads:
+			self.hits += 1
+		else:
+			self.misses += 1
+			self.mention_heads[mention] = mention_head(mention, self.text,
+					self.parses, self.heads)
+		return self.mention_heads[mention]
+
+	def lower_text(self, mention):
+		"""The text of the mention, lower-cased."""
+		if mention in self.texts:
+			self.hits += 1
+		else:
+			self.misses += 1
+			self.texts[mention] = mention_text(mention, self.text).lower()
+		return self.texts[mention]
+
+	def pronoun_properties(self, mention):
+		if mention in self.pronouns:
+			self.hits += 1
+		else:
+			self.misses += 1
+			sentence = mention[0]
+			self.pronouns[mention] = pronoun_properties(
+					mention_text(mention, self.text).lower(), mention,
+					self.parses[sentence], self.heads[sentence], self.lang)
+		return self.pronouns[mention]
+
+
+class MentionLayer:
+	"""A mention to cluster id mapping that only stores how it differs from
+	its parent, which is either a dict or another MentionLayer.
+
+	Behaves like a copy of the parent taken when the layer is created,
+	including the order of iteration.  Changes to a layer are not seen by
+	layers built on it, unless set_all or pop_all is used, which apply the
+	change to this layer and every layer built on it (as if it was made to
+	each copy).  The parent dict must not be modified once layers are made.
+
+	Relabelling a whole cluster is done with a union-find structure over
+	cluster ids, which is applied when values are read, rather than by
+	updating every mention.
+
+	>>> base = {(0, 0, 1): 1, (0, 2, 3): 1, (1, 0, 2): 2}
+	>>> first = MentionLayer(base)
+	>>> second = MentionLayer(first)
+	>>> first.pop((0, 0, 1))
+	1
+	>>> first[(1, 0, 2)] = 3
+	>>> first.items(), second.items()
+	([((0, 2, 3), 1), ((1, 0, 2), 3)], [((0, 0, 1), 1), ((0, 2, 3), 1), ((1, 0, 2), 2)])
+	>>> first.set_all((0, 0, 1), 4)
+	>>> first.items(), second.items()
+	([((0, 2, 3), 1), ((1, 0, 2), 3), ((0, 0, 1), 4)], [((0, 0, 1), 4), ((0, 2, 3), 1), ((1, 0, 2), 2)])
+	>>> first.pop_all((0, 2, 3))
+	1
+	>>> (0, 2, 3) in second, len(second), len(base)
+	(False, 2, 3)
+	>>> second.relabel(4, 2)
+	>>> second.relabel(2, 5)
+	>>> second.items(), second[(0, 0, 1)]
+	([((0, 0, 1), 5), ((1, 0, 2), 5)], 5)
+	"""
+
+	def __init__(self, parent):
+		self.parent = parent
+		self.children = []
+		# mention -> (cluster id, position) or None if removed.  Position is
+		# None for mentions in their place from the base dict, otherwise a
+		# counter value recording when the mention was added.
+		self.changes = {}
+		# cluster id -> cluster id it was relabelled to (union-find parents)
+		self.relabelled = {}
+		if isinstance(parent, MentionLayer):
+			parent.children.append(self)
+			self.base = parent.base
+			self.counter = parent.counter
+		else:
+			self.base = parent
+			self.counter = itertools.count()
+
+	def entry(self, mention):
+		layer = self
+		while layer is not self.base:
+			if mention in layer.changes:
+				return layer.changes[mention]
+			layer = layer.parent
+		if mention in self.base:
+			return (self.base[mention], None)
+		return None
+
+	def __contains__(self, mention):
+		return self.entry(mention) is not None
+
+	def cluster(self, cluster_id):
+		"""Follow relabellings to the current id for a cluster."""
+		root = cluster_id
+		while root in self.relabelled:
+			root = self.relabelled[root]
+		# Path compression
+		while cluster_id != root:
+			self.relabelled[cluster_id], cluster_id = (root,
+					self.relabelled[cluster_id])
+		return root
+
+	def relabel(self, old_id, new_id):
+		"""Move every mention in cluster old_id to cluster new_id.  Both must be
+		current ids (as returned by lookups)."""
+		if old_id != new_id:
+			self.relabelled[old_id] = new_id
+
+	def __getitem__(self, mention):
+		entry = self.entry(mention)
+		if entry is None:
+			raise KeyError(mention)
+		return self.cluster(entry[0])
+
+	def get(self, mention, default=None):
+		entry = self.entry(mention)
+		return default if entry is None else self.cluster(entry[0])
+
+	def protect_children(self, mention, entry):
+		# Keep the current value in layers that would otherwise see this change
+		for child in self.children:
+			if mention not in child.changes:
+				child.changes[mention] = entry
+
+	def __setitem__(self, mention, cluster_id):
+		entry = self.entry(mention)
+		self.protect_children(mention, entry)
+		if entry is None:
+			self.changes[mention] = (cluster_id, next(self.counter))
+		else:
+			self.changes[mention] = (cluster_id, entry[1])
+
+	def pop(self, mention):
+		entry = self.entry(mention)
+		if entry is None:
+			raise KeyError(mention)
+		self.protect_children(mention, entry)
+		self.changes[mention] = None
+		return self.cluster(entry[0])
+
+	def set_all(self, mention, cluster_id, position=None):
+		"""Set the cluster id here and in all layers built on this one."""
+		if position is None:
+			position = next(self.counter)
+		entry = self.entry(mention)
+		if entry is None:
+			entry = (cluster_id, position)
+		else:
+			entry = (cluster_id, entry[1])
+		for child in self.children:
+			child.set_all(mention, cluster_id, position)
+		self.changes[mention] = entry
+		for child in self.children:
+			if child.changes[mention] == entry:
+				child.changes.pop(mention)
+
+	def pop_all(self, mention):
+		"""Remove the mention here and in all layers built on this one."""
+		ans = self.pop(mention)
+		to_clear = list(self.children)
+		while len(to_clear) > 0:
+			layer = to_clear.pop()
+			layer.changes.pop(mention, None)
+			to_clear += layer.children
+		return ans
+
+	def items(self):
+		# Combine the changes along the chain, nearest layer last
+		layers = []
+		layer = self
+		while layer is not self.base:
+			layers.append(layer.changes)
+			layer = layer.parent
+		changes = {}
+		for layer_changes in reversed(layers):
+			changes.update(layer_changes)
+
+		cluster = self.cluster
+		ans = []
+		for mention in self.base:
+			if mention not in changes:
+				ans.append((mention, cluster(self.base[mention])))
+			else:
+				entry = changes[mention]
+				if entry is not None and entry[1] is None:
+					ans.append((mention, cluster(entry[0])))
+		added = []
+		for mention in changes:
+			entry = changes[mention]
+			if entry is not None and entry[1] is not None:
+				added.append((entry[1], mention, cluster(entry[0])))
+		added.sort()
+		ans += [(mention, cluster_id) for _position, mention, cluster_id in added]
+		return ans
+
+	def keys(self):
+		return [mention for mention, _cluster_id in self.items()]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+
 def set_of_clusters(clusters):
 	ans = set()
 	for cluster in clusters:
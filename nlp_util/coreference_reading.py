@@ -2,129 +2,268 @@ from __future__ import print_function, absolute_import
 import os
 import re
 import sys
-import glob
 import fnmatch
+import contextlib
 from collections import defaultdict
-from io import StringIO
+from collections.abc import Sequence
 from nlp_util import pstree
 from nlp_util import treebanks
 from nlp_util import head_finder
 from nlp_util import render_tree
+from nlp_util import timing
+from nlp_util import gold_manifest
+from nlp_util import conll_index
+
+
+class _LazySequence(Sequence):
+	"""A list whose items are computed when first accessed."""
+
+	def __init__(self, length):
+		self.items = [None] * length
+
+	def __len__(self):
+		return len(self.items)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self.items)))]
+		item = self.items[index]
+		if item is None:
+			item = self.compute(index)
+			self.items[index] = item
+		return item
+
+
+class LazyParses(_LazySequence):
+	"""Parse trees for the sentences of a part, each built from its (word,
+	POS, parse bit) rows when first used.  Only sentences containing mentions
+	are usually looked at, so the rest are never built.  Another form of the
+	sentences can be used by giving the function that builds a tree from it,
+	e.g. pstree.tree_from_tuples.
+
+	get_nodes finds the nodes of a sentence with a given span, using an index
+	of the tree's spans (see pstree.PSTree.build_span_index) kept here.
+
+	>>> parses = LazyParses([[('John', 'NNP', '(TOP(S(NP*)'),
+	... 	('slept', 'VBD', '(VP*)))')]])
+	>>> parses.get_nodes(0, 'lowest', 0, 1)
+	(NNP John)
+	>>> parses.get_nodes(0, 'highest', 0, 1)
+	(NP (NNP John))
+	>>> print(parses.get_nodes(0, 'lowest', 2, 3))
+	None
+	"""
 
-
-def read_conll_parses(lines):
-	in_file = StringIO(''.join(lines))
-	return treebanks.read_trees(in_file, treebanks.conll_read_tree)
-
-
-def read_conll_text(lines):
+	def __init__(self, rows, build=treebanks.conll_tree_from_rows):
+		_LazySequence.__init__(self, len(rows))
+		self.rows = rows
+		self.build = build
+		self.span_indexes = [None] * len(rows)
+
+	def compute(self, index):
+		with timing.stage('parse'):
+			tree = self.build(self.rows[index])
+		self.rows[index] = None
+		return tree
+
+	def get_nodes(self, sentence, request='all', start=-1, end=-1):
+		"""As for self[sentence].get_nodes(request, start, end)."""
+		tree = self[sentence]
+		if request == 'all' or start < 0 or end < 0:
+			return tree.get_nodes(request, start, end)
+		index = self.span_indexes[sentence]
+		if index is None:
+			index = tree.build_span_index()
+			self.span_indexes[sentence] = index
+		nodes = index.get((start, end))
+		if not nodes:
+			return None
+		return nodes[0] if request == 'lowest' else nodes[-1]
+
+	def __getstate__(self):
+		# Indexes are cheap to build again, so leave them out of copies
+		state = dict(self.__dict__)
+		state['span_indexes'] = [None] * len(self.items)
+		return state
+
+
+def get_nodes(parses, sentence, request='all', start=-1, end=-1):
+	"""Get nodes from the parse of a sentence as for pstree.PSTree.get_nodes,
+	through LazyParses.get_nodes when parses has one."""
+	if isinstance(parses, LazyParses):
+		return parses.get_nodes(sentence, request, start, end)
+	return parses[sentence].get_nodes(request, start, end)
+
+
+class LazyHeads(_LazySequence):
+	"""Head maps for a LazyParses, each found when first used."""
+
+	def __init__(self, parses, lang=None):
+		_LazySequence.__init__(self, len(parses))
+		self.parses = parses
+		self.lang = lang
+
+	def compute(self, index):
+		parse = self.parses[index]
+		with timing.stage('heads'):
+			return head_finder.collins_find_heads(parse, lang=self.lang)
+
+
+# Coreference column tokens: (12) a single word mention, (12 a start, 12) an
+# end and | a separator
+CONLL_COREF_RE = re.compile("([(][0-9]*[)])|([(][0-9]*)|([0-9]*[)])|([|])")
+
+
+def read_conll_part(lines,
+		rtext=True,
+		rparses=True,
+		rclusters=True,
+		rner=True):
+	"""Read the columns of one part of a CoNLL file, splitting each line once.
+
+	Returns a dict with the requested fields: 'text' (a list of words for each
+	sentence), 'parses' (a tree for each sentence, built on first use, see
+	LazyParses), 'mentions' and 'clusters'
+	(from the last column, see read_conll_coref) and 'ner' (a map from spans to
+	types).
+
+	>>> rows = [('John', 'NNP', '(TOP(S(NP*)', '(PERSON)', '(0)'),
+	... 	('slept', 'VBD', '(VP*)', '*', '-'), ('.', '.', '*))', '*', '-'), None,
+	... 	('He', 'PRP', '(TOP(S(NP*)', '*', '(0)'),
+	... 	('left', 'VBD', '(VP*)))', '*', '-'), None]
+	>>> lines = ['d 0 0 %s %s %s - - - - %s %s\\n' % row if row else '\\n'
+	... 	for row in rows]
+	>>> info = read_conll_part(lines)
+	>>> info['text']
+	[['John', 'slept', '.'], ['He', 'left']]
+	>>> print(info['parses'][1])
+	(TOP (S (NP (PRP He)) (VP (VBD left))))
+	>>> info['mentions'], dict(info['clusters'])
+	({(0, 0, 1): 0, (1, 0, 1): 0}, {0: [(0, 0, 1), (1, 0, 1)]})
+	>>> info['ner']
+	{(0, 0, 1): 'PERSON'}
+	"""
 	text = [[]]
-	for line in lines:
-		fields = line.strip().split()
-		if len(fields) == 0:
-			text.append([])
-		else:
-			text[-1].append(fields[3])
-	if len(text[-1]) == 0:
-		text.pop()
-	return text
-
+	sentence_rows = []
+	rows = []
+	ner = {}
+	ner_open = []
+	mentions = {}  # (sentence, start, end+1) -> ID
+	clusters = defaultdict(list)  # ID -> list of (sentence, start, end+1)s
+	unmatched_mentions = defaultdict(list)
 
-def read_conll_ner(lines):
-	info = {}
-	word = 0
 	sentence = 0
-	cur = []
+	word = 0
+	line_no = 0
 	for line in lines:
-		fields = line.strip().split()
-		if len(fields) >= 11:
+		line_no += 1
+		if len(line) > 0 and line[0] == '#':
+			continue
+		fields = line.split()
+		if len(fields) == 0:
+			if rtext:
+				text.append([])
+			if rparses:
+				sentence_rows.append(rows)
+				rows = []
+			sentence += 1
+			word = 0
+			unmatched_mentions = defaultdict(list)
+			continue
+
+		if rtext:
+			text[-1].append(fields[3])
+		if rparses:
+			try:
+				rows.append((fields[3], fields[4], fields[5]))
+			except IndexError:
+				raise ValueError('conll file does not contain a POS tag column.')
+		if rner and len(fields) >= 11:
 			ner_info = fields[10]
 			if '(' in ner_info and '*' in ner_info:
-				cur.append((ner_info[1:-1], sentence, word))
+				ner_open.append((ner_info[1:-1], sentence, word))
 			elif '(' in ner_info and ')' in ner_info:
-				info[sentence, word, word + 1] = ner_info[1:-1]
+				ner[sentence, word, word + 1] = ner_info[1:-1]
 			elif ')' in ner_info and '*' in ner_info:
-				start = cur.pop()
+				start = ner_open.pop()
 				if sentence != start[1]:
 					print("Something mucked up", sentence, word, start,
 							file=sys.stderr)
-				info[sentence, start[2], word + 1] = start[0]
+				ner[sentence, start[2], word + 1] = start[0]
+		coref = fields[-1]
+		if rclusters and ('(' in coref or ')' in coref):
+			for triple in CONLL_COREF_RE.findall(coref):
+				if triple[1] != '':
+					val = int(triple[1][1:])
+					unmatched_mentions[(sentence, val)].append(word)
+				elif triple[0] != '' or triple[2] != '':
+					start = word
+					val = -1
+					if triple[0] != '':
+						val = int(triple[0][1:-1])
+					else:
+						val = int(triple[2][:-1])
+						if (sentence, val) not in unmatched_mentions:
+							print("Ignoring a mention with no start", end=' ',
+									file=sys.stderr)
+							print(str(val), line.strip(), line_no,
+									file=sys.stderr)
+							continue
+						if len(unmatched_mentions[(sentence, val)]) == 0:
+							print("No other start available", str(val),
+									line.strip(), line_no, file=sys.stderr)
+							continue
+						start = unmatched_mentions[(sentence, val)].pop()
+					end = word + 1
+					if (sentence, start, end) in mentions:
+						print('Duplicate mention',
+								sentence, start, end, val,
+								mentions[sentence, start, end], file=sys.stderr)
+					else:
+						mentions[sentence, start, end] = val
+						clusters[val].append((sentence, start, end))
 		word += 1
-		if len(fields) == 0:
-			sentence += 1
-			word = 0
+
+	info = {}
+	if rtext:
+		if len(text[-1]) == 0:
+			text.pop()
+		info['text'] = text
+	if rparses:
+		# A final sentence with no blank line after it
+		if len(rows) > 0:
+			sentence_rows.append(rows)
+		info['parses'] = LazyParses(sentence_rows)
+	if rclusters:
+		for key in unmatched_mentions:
+			if len(unmatched_mentions[key]) > 0:
+				print("Mention started, but did not end ", str(
+						unmatched_mentions[key]), file=sys.stderr)
+		info['mentions'] = mentions
+		info['clusters'] = clusters
+	if rner:
+		info['ner'] = ner
 	return info
 
 
+def read_conll_parses(lines):
+	return list(read_conll_part(lines, False, True, False, False)['parses'])
+
+
+def read_conll_text(lines):
+	return read_conll_part(lines, True, False, False, False)['text']
+
+
+def read_conll_ner(lines):
+	return read_conll_part(lines, False, False, False, True)['ner']
+
+
 def read_conll_coref(lines):
 	# Assumes:
 	#  - Reading a single part
 	#  - If duplicate mentions occur, use the first
-	regex = "([(][0-9]*[)])|([(][0-9]*)|([0-9]*[)])|([|])"
-	mentions = {}  # (sentence, start, end+1) -> ID
-	clusters = defaultdict(lambda: []
-			)  # ID -> list of (sentence, start, end+1)s
-	unmatched_mentions = defaultdict(lambda: [])
-
-	sentence = 0
-	word = 0
-	line_no = 0
-	for line in lines:
-		line_no += 1
-		if len(line) > 0 and line[0] == '#':
-			continue
-		line = line.strip()
-		if len(line) == 0:
-			sentence += 1
-			word = 0
-			unmatched_mentions = defaultdict(lambda: [])
-			continue
-		fields = line.strip().split()
-		for triple in re.findall(regex, fields[-1]):
-			if triple[1] != '':
-				val = int(triple[1][1:])
-				unmatched_mentions[(sentence, val)].append(word)
-			elif triple[0] != '' or triple[2] != '':
-				start = word
-				val = -1
-				if triple[0] != '':
-					val = int(triple[0][1:-1])
-				else:
-					val = int(triple[2][:-1])
-					if (sentence, val) not in unmatched_mentions:
-						# print ''.join(lines[:20])
-						# print triple
-						# print fields
-						# print line
-						# print line_no, len(lines)
-						# raise Exception(
-						# 		"Ending mention with no start: " + str(val))
-						print("Ignoring a mention with no start", end=' ',
-								file=sys.stderr)
-						print(str(val), line.strip(), line_no, file=sys.stderr)
-						continue
-					if len(unmatched_mentions[(sentence, val)]) == 0:
-						print("No other start available", str(
-								val), line.strip(), line_no, file=sys.stderr)
-						continue
-					start = unmatched_mentions[(sentence, val)].pop()
-				end = word + 1
-				if (sentence, start, end) in mentions:
-					print('Duplicate mention',
-							sentence, start, end, val,
-							mentions[sentence, start, end], file=sys.stderr)
-				else:
-					mentions[sentence, start, end] = val
-					clusters[val].append((sentence, start, end))
-		word += 1
-	for key in unmatched_mentions:
-		if len(unmatched_mentions[key]) > 0:
-			print("Mention started, but did not end ", str(
-					unmatched_mentions[key]), file=sys.stderr)
-			# raise Exception(
-			# 		"Mention started, but did not end "
-			# 		+ str(unmatched_mentions[key]))
-	return mentions, clusters
+	info = read_conll_part(lines, False, False, True, False)
+	return info['mentions'], info['clusters']
 
 
 def read_stanford_coref(filename, gold_text):
@@ -492,6 +631,69 @@ def read_reconcile_coref(filename, gold_text):
 	return {'clusters': clusters, 'mentions': mentions, 'text': text}
 
 
+def generate_conll_parts(filename,
+		rtext=True,
+		rparses=True,
+		rheads=True,
+		rclusters=True,
+		rner=True,
+		lang=None,
+		cache=None,
+		select=None):
+	"""Read a CoNLL file one part at a time, yielding (doc, part, info).
+
+	Only the part being yielded is held in memory, info is a dict with the
+	same fields as the values produced by read_conll_doc.  If a
+	conll_cache.ConllCache is given parts are loaded from it, or written to it
+	as they are read (the entry is only kept once the whole file has been
+	read).  If select is given, only parts for which select(doc,
+	part) is true are read, using a conll_index to skip over the others."""
+	if cache is not None:
+		key = (lang, rtext, rparses, rheads, rclusters, rner)
+		parts = cache.load(filename, key)
+		if parts is None:
+			parts = cache.write_through(filename, key,
+					generate_conll_parts(filename, rtext, rparses, rheads,
+						rclusters, rner, lang))
+		with contextlib.closing(parts):
+			for doc, part, info in parts:
+				if select is None or select(doc, part):
+					yield doc, part, info
+		return
+
+	# Closing the generator early (e.g. when a consumer stops) closes the file
+	if select is None:
+		source = open(filename)
+	else:
+		source = contextlib.closing(conll_index.selected_lines(filename,
+				select))
+	with source as lines:
+		cur = []
+		keys = None
+		for line in lines:
+			if len(line) > 0 and line.startswith('#begin') or (
+					line.startswith('#end')):
+				if 'begin' in line:
+					keys = conll_index.part_keys(line)
+				if len(cur) > 0:
+					if keys is None:
+						print("Error reading conll file - ", end=' ',
+								file=sys.stderr)
+						print("invalid #begin statement\n", line,
+								file=sys.stderr)
+					else:
+						with timing.stage('parse'):
+							info = read_conll_part(cur, rtext, rparses,
+									rclusters, rner)
+						if rparses and rheads:
+							info['heads'] = LazyHeads(info['parses'], lang)
+						yield keys[0], keys[1], info
+						keys = None
+				cur = []
+			else:
+				cur.append(line)
+
+
 def read_conll_doc(filename,
 		ans=None,
 		rtext=True,
@@ -499,8 +701,11 @@ def read_conll_doc(filename,
 		rheads=True,
 		rclusters=True,
 		rner=True,
-		lang=None):
-	# Read entire file, inserting into a dictionary:
+		lang=None,
+		cache=None,
+		select=None):
+	# Read entire file (or the parts chosen by select, see
+	# generate_conll_parts), inserting into a dictionary:
 	#  key - the #begin <blah> info
 	#  value - a dict, one entry per part, each entry contains:
 	#     - text
@@ -509,91 +714,127 @@ def read_conll_doc(filename,
 	#     - coreference clusters
 	if ans is None:
 		ans = defaultdict(lambda: {})
-	cur = []
-	keys = None
-	for line in open(filename):
-		if len(line) > 0 and line.startswith('#begin') or line.startswith(
-				'#end'):
-			if 'begin' in line:
-				desc = line.split()
-				location = desc[2].strip('();')
-				keys = (location, desc[-1])
-				if "tc/ch/00/ch" in keys[0] and '9' not in keys[0]:
-					val = int(keys[0].split('_')[-1]) * 10 - 1
-					keys = ("tc/ch/00/ch_%04d" % val, keys[1])
-			if len(cur) > 0:
-				if keys is None:
-					print("Error reading conll file - ", end=' ', file=sys.stderr)
-					print("invalid #begin statement\n", line, file=sys.stderr)
-				else:
-					info = {}
-					if rtext:
-						info['text'] = read_conll_text(cur)
-					if rparses:
-						info['parses'] = read_conll_parses(cur)
-						if rheads:
-							info['heads'] = [
-									head_finder.collins_find_heads(parse,
-									lang=lang)
-									for parse in info['parses']
-							]
-					if rclusters:
-						info['mentions'], info['clusters'] = read_conll_coref(
-								cur)
-					if rner:
-						info['ner'] = read_conll_ner(cur)
-					ans[keys[0]][keys[1]] = info
-					keys = None
-			cur = []
-		else:
-			cur.append(line)
+	for doc, part, info in generate_conll_parts(filename, rtext, rparses,
+			rheads, rclusters, rner, lang, cache, select):
+		ans[doc][part] = info
 	return ans
 
 
 def read_conll_gold_files(dir_prefix):
 	ans = defaultdict(lambda: {})
-	query = os.path.join(dir_prefix, '*/*/*/*gold*conll')
-	for filename in glob.glob(query):
+	manifest = gold_manifest.for_directory(dir_prefix)
+	for filename in manifest.glob('*/*/*/*gold*conll'):
 		read_conll_doc(filename, ans)
 	return ans
 
 
-def read_conll_coref_system_output(filename, ans=None):
-	return read_conll_doc(filename, ans, False, False, False, True)
+def read_conll_coref_system_output(filename, ans=None, select=None):
+	return read_conll_doc(filename, ans, False, False, False, True,
+			select=select)
+
+
+def generate_conll_coref_system_output(filename, select=None):
+	return generate_conll_parts(filename, False, False, False, True,
+			select=select)
+
+
+def find_conll_matching_file(dir_prefix, filename):
+	"""Return the path of the gold file for a document, or None if there is no
+	unique match.  The directory is listed once, see gold_manifest."""
+	filenames = gold_manifest.for_directory(dir_prefix).matches(filename)
+	if len(filenames) == 1:
+		return filenames[0]
+	print(("Reading matching doc failed for %s/%s as "
+			"%d files were found."
+			% (dir_prefix, filename, len(filenames))), file=sys.stderr)
+	return None
 
 
-def read_conll_matching_file(dir_prefix, filename, ans=None, lang=None):
+def read_conll_matching_file(dir_prefix, filename, ans=None, lang=None,
+		cache=None, select=None):
 	if ans is None:
 		ans = defaultdict(lambda: {})
-	query = os.path.join(dir_prefix, filename + '.conll')
-	if os.path.exists(query):  # prefer exact match
-		read_conll_doc(query, ans, lang=lang)
-		return ans
-	query = os.path.join(dir_prefix, filename + '*conll')
-	filenames = glob.glob(query)
-	if len(filenames) > 1:
-		query = os.path.join(dir_prefix, filename + '*gold*conll')
-		filenames = glob.glob(query)
-	if len(filenames) == 1:
-		read_conll_doc(filenames[0], ans, lang=lang)
-	else:
-		print(("Reading matching doc failed for %s/%s as "
-				"%d files were found."
-				% (dir_prefix, filename, len(filenames))), file=sys.stderr)
+	query = find_conll_matching_file(dir_prefix, filename)
+	if query is not None:
+		read_conll_doc(query, ans, lang=lang, cache=cache, select=select)
 	return ans
 
 
-def read_conll_matching_files(conll_docs, dir_prefix, lang=None):
-	# Read the corresponding file under dir_prefix
+def read_conll_matching_files(conll_docs, dir_prefix, lang=None, cache=None,
+		subset=False):
+	# Read the corresponding file under dir_prefix.  With subset, only the
+	# parts of the document in conll_docs are read from each file.
 	ans = None
 	for filename in conll_docs:
-		if "tc/ch/00/ch" in filename and '9' not in filename:
-			val = int(filename.split('_')[-1]) * 10 - 1
-			filename = "tc/ch/00/ch_%04d" % val
-		ans = read_conll_matching_file(dir_prefix, filename, ans, lang=lang)
+		select = None
+		if subset:
+			parts = conll_docs[filename]
+			select = lambda doc, part, name=filename, parts=parts: (
+					doc == name and part in parts)
+		ans = read_conll_matching_file(dir_prefix, filename, ans, lang=lang,
+				cache=cache, select=select)
 	return ans
 
 
+def sorted_matching_parts(auto, gold):
+	"""Yield (doc, part, gold info, system info) for every part of the system
+	output, in sorted order."""
+	order = []
+	for doc in auto:
+		for part in auto[doc]:
+			order.append((doc, part))
+	order.sort()
+	for doc, part in order:
+		if doc not in gold or part not in gold[doc]:
+			print(doc, part, "not in gold", file=sys.stderr)
+		yield doc, part, gold[doc][part], auto[doc][part]
+
+
+def generate_conll_matching_parts(system_parts, dir_prefix, lang=None,
+		cache=None):
+	"""Walk the system output and the gold files together, yielding
+	(doc, part, gold info, system info).
+
+	Parts are produced in the order of the system output, and only the gold
+	part currently being yielded (with its parses and heads) is kept in
+	memory.  Parts with no gold equivalent are reported and skipped."""
+	gold_doc = None
+	gold_file = None
+	gold_parts = iter(())
+	for doc, part, auto_info in system_parts:
+		filename = gold_manifest.gold_document_name(doc)
+		if filename != gold_doc:
+			if cache is not None:
+				# Finish the file so that its cache entry is kept
+				for _item in gold_parts:
+					pass
+			gold_doc = filename
+			gold_file = find_conll_matching_file(dir_prefix, filename)
+			gold_parts = iter(())
+			if gold_file is not None:
+				gold_parts = generate_conll_parts(gold_file, lang=lang,
+						cache=cache)
+		gold_info = None
+		# Parts normally appear in the same order in both files, if not then
+		# start from the top of the gold file again.
+		for attempt in range(2):
+			for gdoc, gpart, info in gold_parts:
+				if gdoc == doc and gpart == part:
+					gold_info = info
+					break
+			if gold_info is not None or gold_file is None:
+				break
+			gold_parts = generate_conll_parts(gold_file, lang=lang,
+					cache=cache)
+		if gold_info is None:
+			print(doc, part, "not in gold", file=sys.stderr)
+			continue
+		yield doc, part, gold_info, auto_info
+	if cache is not None:
+		for _item in gold_parts:
+			pass
+
+
 def read_conll_all(dir_prefix, suffix="auto_conll"):
 	ans = None
 	for root, dirnames, filenames in os.walk(dir_prefix):
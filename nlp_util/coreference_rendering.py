@@ -1,6 +1,5 @@
 from __future__ import print_function, absolute_import
 import sys
-import string
 from collections import defaultdict
 from nlp_util import render_tree
 from nlp_util import head_finder
@@ -23,43 +22,10 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions,
 		auto_clusters, auto_cluster_set, text, parses, heads):
 	# Apply changes for cases where the difference is only leading or trailing
 	# punctuation
-	mapping = {}
-	used_gold = set()
 	unique_to_gold = gold_mention_set.difference(auto_mention_set)
 	unique_to_auto = auto_mention_set.difference(gold_mention_set)
-	for amention in unique_to_auto:
-		sentence, astart, aend = amention
-		while (aend - astart > 1
-				and (text[sentence][astart] == "the"
-					or (len(text[sentence][astart]) == 1
-						and text[sentence][astart][0]
-							not in string.ascii_letters))):
-			astart += 1
-		while (aend - astart > 1
-				and (text[sentence][aend - 1] == "'s"
-					or (len(text[sentence][aend - 1]) == 1
-						and text[sentence][aend - 1][0]
-							not in string.ascii_letters))):
-			aend -= 1
-		for gmention in unique_to_gold:
-			gsentence, gstart, gend = gmention
-			if sentence != gsentence or gmention in used_gold:
-				continue
-			while (gend - gstart > 1
-					and (text[sentence][gstart] == "the"
-						or (len(text[sentence][gstart]) == 1
-							and text[sentence][gstart][0]
-								not in string.ascii_letters))):
-				gstart += 1
-			while (gend - gstart > 1
-					and (text[sentence][gend - 1] == "'s"
-						or (len(text[sentence][gend - 1]) == 1
-							and text[sentence][gend - 1][0]
-								not in string.ascii_letters))):
-				gend -= 1
-			if astart == gstart and aend == gend:
-				mapping[amention] = gmention
-				used_gold.add(gmention)
+	mapping = coreference.match_trimmed_mentions(unique_to_gold,
+			unique_to_auto, text)
 	# Apply mapping to create new auto_mention_set
 	for mention in mapping:
 		auto_mention_set.remove(mention)
@@ -136,43 +102,65 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions,
 
 
 def print_conll_style_part(out, text, mentions, doc, part):
-	doc_str = doc
-	if "tc/ch/00/ch" in doc_str and '9' not in doc_str:
-		val = int(doc_str.split('_')[-1]) * 10 - 1
-		doc_str = "tc/ch/00/ch_%04d" % val
-	print("#begin document (%s); part %s" % (doc_str, part), file=out)
+	print_conll_style_parts([(out, mentions)], text, doc, part)
+
+
+def conll_coref_column(mentions):
+	"""Return a dict from (sentence, word) to the coreference column text for
+	every word that has a mention starting or ending at it.
+
+	>>> conll_coref_column({(0, 0, 2): 1, (0, 1, 2): 2, (0, 1, 3): 3})
+	{(0, 0): '(1', (0, 1): '(3|(2)|1)', (0, 2): '3)'}
+	"""
 	starts = defaultdict(lambda: [])
 	ends = defaultdict(lambda: [])
 	singles = defaultdict(lambda: [])
-	for mention in mentions:
-		cluster_id = mentions[mention]
+	for mention, cluster_id in mentions.items():
 		if mention[2] - mention[1] == 1:
 			singles[mention[0], mention[1]].append(cluster_id)
 		else:
 			starts[mention[0], mention[1]].append(cluster_id)
 			ends[mention[0], mention[2] - 1].append(cluster_id)
 
+	ans = {}
+	for position in sorted(set(starts).union(singles, ends)):
+		coref = []
+		for cluster_id in starts.get(position, []):
+			coref.append('(' + str(cluster_id))
+		for cluster_id in singles.get(position, []):
+			coref.append('(' + str(cluster_id) + ')')
+		for cluster_id in ends.get(position, []):
+			coref.append(str(cluster_id) + ')')
+		ans[position] = '|'.join(coref)
+	return ans
+
+
+def print_conll_style_parts(outputs, text, doc, part):
+	"""Print several sets of mentions over the same text in CoNLL format.
+
+	outputs is a list of (file, mentions) pairs.  The text is walked once for
+	all of them, and each file gets a single write."""
+	if len(outputs) == 0:
+		return
+	doc_str = doc
+	if "tc/ch/00/ch" in doc_str and '9' not in doc_str:
+		val = int(doc_str.split('_')[-1]) * 10 - 1
+		doc_str = "tc/ch/00/ch_%04d" % val
+	columns = [conll_coref_column(mentions) for _out, mentions in outputs]
+	lines = [["#begin document (%s); part %s\n" % (doc_str, part)]
+			for _output in outputs]
+	prefix = "%s\t%d\t" % (doc_str, int(part))
 	for i in range(len(text)):
 		for j in range(len(text[i])):
-			coref = []
-			if (i, j) in starts:
-				for cluster_id in starts[i, j]:
-					coref.append('(' + str(cluster_id))
-			if (i, j) in singles:
-				for cluster_id in singles[i, j]:
-					coref.append('(' + str(cluster_id) + ')')
-			if (i, j) in ends:
-				for cluster_id in ends[i, j]:
-					coref.append(str(cluster_id) + ')')
-			if len(coref) == 0:
-				coref = '-'
-			else:
-				coref = '|'.join(coref)
-			print("%s\t%d\t%d\t%s\t%s" % (doc_str, int(part), j,
-					text[i][j], coref), file=out)
-		print(file=out)
+			line = "%s%d\t%s\t" % (prefix, j, text[i][j])
+			for column, olines in zip(columns, lines):
+				olines.append(line + column.get((i, j), '-') + '\n')
+		for olines in lines:
+			olines.append('\n')
 
-	print("#end document", file=out)
+	for (out, _mentions), olines in zip(outputs, lines):
+		olines.append("#end document\n")
+		out.write(''.join(olines))
 
 
 def print_conll_style(data, gold, out):
@@ -193,7 +181,8 @@ def mention_text(text, mention, parses=None, heads=None, colour=None):
 	sentence, start, end = mention
 	head = None
 	if parses is not None and heads is not None and end - start > 1:
-		node = parses[sentence].get_nodes('lowest', start, end)
+		node = coreference_reading.get_nodes(parses, sentence, 'lowest',
+				start, end)
 		if node is not None:
 			head = head_finder.get_head(heads[sentence], node)
 	ans = []
@@ -253,7 +242,8 @@ def print_headless_mentions(out, parses, heads, mentions):
 	for mention in mentions:
 		sentence, start, end = mention
 		if end - start > 1:
-			node = parses[sentence].get_nodes('lowest', start, end)
+			node = coreference_reading.get_nodes(parses, sentence, 'lowest',
+					start, end)
 			if node is None:
 				print(mention_text(text, mention), file=out)
 				print(render_tree.text_tree(parses[sentence], False), file=out)
@@ -583,14 +573,14 @@ for extra, and purple where they overlap."""
 	word_colours = {}
 	heads = set()
 	for mention in gold_mentions:
-		node = gold_parses[mention[0]].get_nodes('lowest', mention[1],
-				mention[2])
+		node = coreference_reading.get_nodes(gold_parses, mention[0],
+				'lowest', mention[1], mention[2])
 		if node is not None:
 			head = head_finder.get_head(gold_heads[mention[0]], node)
 			heads.add((mention[0], head[0][0]))
 	for mention in auto_mention_set:
-		node = gold_parses[mention[0]].get_nodes('lowest', mention[1],
-				mention[2])
+		node = coreference_reading.get_nodes(gold_parses, mention[0],
+				'lowest', mention[1], mention[2])
 		if node is not None:
 			head = head_finder.get_head(gold_heads[mention[0]], node)
 			heads.add((mention[0], head[0][0]))
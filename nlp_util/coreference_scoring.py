@@ -0,0 +1,257 @@
+"""Coreference metrics, computed in-process from mention to cluster maps.
+
+These follow the definitions used by the CoNLL reference scorer (version 8,
+Pradhan et al., 2014).  Each metric gives counts for a single document part,
+counts are summed over parts, and precision and recall are calculated from the
+totals, as in the TOTALS section of the scorer output.  The results have the
+same form as those of coreference_reading.read_conll_scorer_output.
+
+Example from Pradhan et al. (2014), with single word mentions a to i:
+>>> m = {name: (0, i, i + 1) for i, name in enumerate('abcdefghi')}
+>>> gold = {m['a']: 1, m['b']: 1, m['c']: 1,
+... 		m['d']: 2, m['e']: 2, m['f']: 2, m['g']: 2}
+>>> auto = {m['a']: 1, m['b']: 1, m['c']: 2, m['d']: 2,
+... 		m['f']: 3, m['g']: 3, m['h']: 3, m['i']: 3}
+>>> totals = {}
+>>> add_counts(totals, score_part(gold, auto))
+>>> results = scores(totals)
+>>> for metric in METRICS + ['conll']:
+... 	print(metric, [round(100 * a, 2) for a in results[metric]])
+mentions [75.0, 85.71, 80.0]
+muc [40.0, 40.0, 40.0]
+bcub [50.0, 41.67, 45.45]
+ceafm [50.0, 57.14, 53.33]
+ceafe [43.33, 65.0, 52.0]
+blanc [32.5, 44.44, 37.55]
+conll [44.44, 48.89, 45.82]
+"""
+from __future__ import print_function, absolute_import
+from collections import defaultdict
+from nlp_util import coreference, ceaf
+
+METRICS = ['mentions', 'muc', 'bcub', 'ceafm', 'ceafe', 'blanc']
+
+
+def clusters_by_id(mentions):
+	"""Convert a mention -> cluster id map into a cluster id -> set map."""
+	clusters = defaultdict(set)
+	for mention, cluster_id in mentions.items():
+		clusters[cluster_id].add(mention)
+	return clusters
+
+
+def conll_mentions(mentions):
+	"""The mentions that are read back after writing these in the CoNLL format.
+
+	Each closing bracket is paired with the most recent unmatched opening
+	bracket for the same cluster, so crossing mentions in a cluster come back
+	with different spans.  The reference scorer sees the file, so the scores
+	here are calculated on the same mentions.
+
+	>>> sorted(conll_mentions({(0, 1, 4): 1, (0, 2, 6): 1, (0, 3, 5): 2}).items())
+	[((0, 1, 6), 1), ((0, 2, 4), 1), ((0, 3, 5), 2)]
+	"""
+	groups = defaultdict(list)
+	for mention, cluster_id in mentions.items():
+		if mention[2] - mention[1] > 1:
+			groups[mention[0], cluster_id].append(mention)
+	ans = mentions
+	for (sentence, cluster_id), group in groups.items():
+		if len(group) < 2:
+			continue
+		starts = defaultdict(int)
+		ends = defaultdict(int)
+		for mention in group:
+			starts[mention[1]] += 1
+			ends[mention[2] - 1] += 1
+		paired = []
+		unmatched = []
+		for word in sorted(set(starts).union(ends)):
+			unmatched += [word] * starts[word]
+			for _ in range(ends[word]):
+				paired.append((sentence, unmatched.pop(), word + 1))
+		if set(paired) != set(group):
+			if ans is mentions:
+				ans = dict(mentions)
+			for mention in group:
+				ans.pop(mention)
+			for mention in paired:
+				if mention not in ans:
+					ans[mention] = cluster_id
+	return ans
+
+
+def mention_counts(gold, auto):
+	"""Counts for mention identification (exact span match)."""
+	matched = len(gold.keys() & auto.keys())
+	return [matched, len(gold), matched, len(auto)]
+
+
+def muc_counts(gold_clusters, auto_mentions, auto_clusters, gold_mentions):
+	"""Counts for MUC, Vilain et al. (1995).
+
+	A cluster contributes its size minus the number of pieces it is split into
+	by the other clustering (mentions absent from the other side are pieces on
+	their own)."""
+	recall = [0, 0]
+	precision = [0, 0]
+	for clusters, other, counts in [(gold_clusters, auto_mentions, recall),
+			(auto_clusters, gold_mentions, precision)]:
+		for cluster in clusters:
+			pieces = set()
+			missing = 0
+			for mention in cluster:
+				if mention in other:
+					pieces.add(other[mention])
+				else:
+					missing += 1
+			counts[0] += len(cluster) - len(pieces) - missing
+			counts[1] += len(cluster) - 1
+	return recall + precision
+
+
+def overlaps(gold_clusters, auto_mentions):
+	"""For each gold cluster, a map from auto cluster ids to the number of
+	mentions they share."""
+	ans = []
+	for cluster in gold_clusters:
+		overlap = defaultdict(int)
+		for mention in cluster:
+			if mention in auto_mentions:
+				overlap[auto_mentions[mention]] += 1
+		ans.append(overlap)
+	return ans
+
+
+def bcub_counts(gold_clusters, auto_sizes, overlap, gold_total, auto_total):
+	"""Counts for B-cubed, Bagga and Baldwin (1998)."""
+	recall = 0.0
+	precision = 0.0
+	for cluster, shared in zip(gold_clusters, overlap):
+		for auto_id, count in shared.items():
+			recall += count * count / float(len(cluster))
+			precision += count * count / float(auto_sizes[auto_id])
+	return [recall, gold_total, precision, auto_total]
+
+
+def ceaf_counts(groups, gold_total, auto_total, similarity):
+	"""Counts for CEAF, Luo (2005), with the given cluster similarity."""
+	total = ceaf.alignment(groups, similarity)
+	return [total, gold_total, total, auto_total]
+
+
+def pairs(count):
+	return count * (count - 1) // 2
+
+
+def blanc_counts(gold_clusters, auto_clusters, overlap, gold_mentions,
+		auto_mentions):
+	"""Link counts for BLANC, Recasens and Hovy (2011), as extended to system
+	mentions by Luo et al. (2014): shared coreference links, gold coreference
+	links, auto coreference links, and the same for non-coreference links."""
+	gold_links = sum(pairs(len(cluster)) for cluster in gold_clusters)
+	auto_links = sum(pairs(len(cluster)) for cluster in auto_clusters)
+	shared_links = 0
+	for shared in overlap:
+		for count in shared.values():
+			shared_links += pairs(count)
+	gold_non_links = pairs(len(gold_mentions)) - gold_links
+	auto_non_links = pairs(len(auto_mentions)) - auto_links
+
+	# Non-links shared are pairs of mentions present on both sides that are
+	# linked on neither side
+	common = gold_mentions.keys() & auto_mentions.keys()
+	common_gold_links = 0
+	for cluster in gold_clusters:
+		common_gold_links += pairs(len(cluster & common))
+	common_auto_links = 0
+	for cluster in auto_clusters:
+		common_auto_links += pairs(len(cluster & common))
+	shared_non_links = (pairs(len(common)) - common_gold_links -
+			common_auto_links + shared_links)
+	return [shared_links, gold_links, auto_links, shared_non_links,
+			gold_non_links, auto_non_links]
+
+
+def score_part(gold_mentions, auto_mentions):
+	"""Counts for every metric, comparing two mention -> cluster id maps.
+
+	Either can be anything with an items method giving (mention, cluster id)
+	pairs, such as a coreference.MentionLayer."""
+	gold_mentions = conll_mentions(dict(gold_mentions.items()))
+	auto_mentions = conll_mentions(dict(auto_mentions.items()))
+	gold_by_id = clusters_by_id(gold_mentions)
+	auto_by_id = clusters_by_id(auto_mentions)
+	gold_clusters = list(gold_by_id.values())
+	auto_clusters = list(auto_by_id.values())
+	auto_sizes = {auto_id: len(auto_by_id[auto_id]) for auto_id in auto_by_id}
+	overlap = overlaps(gold_clusters, auto_mentions)
+	groups = coreference.confusion_groups(gold_mentions, auto_mentions,
+			gold_by_id, auto_by_id)
+	gold_total = len(gold_mentions)
+	auto_total = len(auto_mentions)
+	return {
+			'mentions': mention_counts(gold_mentions, auto_mentions),
+			'muc': muc_counts(gold_clusters, auto_mentions, auto_clusters,
+				gold_mentions),
+			'bcub': bcub_counts(gold_clusters, auto_sizes, overlap, gold_total,
+				auto_total),
+			'ceafm': ceaf_counts(groups, gold_total, auto_total,
+				ceaf.mention_similarity),
+			'ceafe': ceaf_counts(groups, len(gold_clusters), len(auto_clusters),
+				ceaf.entity_similarity),
+			'blanc': blanc_counts(gold_clusters, auto_clusters, overlap,
+				gold_mentions, auto_mentions),
+	}
+
+
+def add_counts(totals, counts):
+	"""Add the counts for one part (from score_part) to a running total."""
+	for metric in counts:
+		if metric not in totals:
+			totals[metric] = [0] * len(counts[metric])
+		for i, value in enumerate(counts[metric]):
+			totals[metric][i] += value
+
+
+def ratio(num, den):
+	if den == 0:
+		return 0.0
+	return num / float(den)
+
+
+def prf(precision, recall):
+	fscore = 0.0
+	if precision + recall > 0:
+		fscore = 2 * precision * recall / (precision + recall)
+	return [precision, recall, fscore]
+
+
+def scores(totals):
+	"""Precision, recall and F-score for each metric, and the CoNLL score (the
+	average of MUC, B-cubed and CEAF-e)."""
+	results = {}
+	for metric in METRICS:
+		if metric not in totals:
+			continue
+		counts = totals[metric]
+		if metric == 'blanc':
+			shared, gold, auto, shared_non, gold_non, auto_non = counts
+			recall = [ratio(shared, gold), ratio(shared_non, gold_non)]
+			precision = [ratio(shared, auto), ratio(shared_non, auto_non)]
+			if gold == 0 and auto == 0:
+				# No coreference links, so only non-coreference links count
+				recall, precision = recall[1:], precision[1:]
+			elif gold_non == 0 and auto_non == 0:
+				recall, precision = recall[:1], precision[:1]
+			results[metric] = prf(sum(precision) / len(precision),
+					sum(recall) / len(recall))
+		else:
+			results[metric] = prf(ratio(counts[2], counts[3]),
+					ratio(counts[0], counts[1]))
+	if 'ceafe' in results and 'muc' in results and 'bcub' in results:
+		results['conll'] = [0, 0, 0]
+		for metric in ['muc', 'bcub', 'ceafe']:
+			for i in range(3):
+				results['conll'][i] += results[metric][i] / 3.0
+	return results
@@ -0,0 +1,135 @@
+"""An in-memory index of the CoNLL files in a gold directory.
+
+Finding the gold file for each document with os.path.exists and glob costs
+several filesystem calls per document, which adds up on a networked
+filesystem.  A GoldManifest lists the directory once, or loads the list from
+an index file saved by an earlier run, and then matches documents in memory
+using the same rules as the globs it replaces:
+
+>>> manifest = GoldManifest('gold', [
+... 	'nw/wsj/00/wsj_0020.v4_gold_conll', 'nw/wsj/00/wsj_0020.v4_auto_conll',
+... 	'bn/cnn/01/cnn_0100.conll', 'bn/cnn/01/cnn_0100_a.conll',
+... 	'tc/ch/00/ch_0009.v4_gold_conll'])
+>>> manifest.matches('nw/wsj/00/wsj_0020')
+['gold/nw/wsj/00/wsj_0020.v4_gold_conll']
+>>> manifest.matches('bn/cnn/01/cnn_0100')
+['gold/bn/cnn/01/cnn_0100.conll']
+>>> manifest.matches('tc/ch/00/ch_0001')
+['gold/tc/ch/00/ch_0009.v4_gold_conll']
+>>> manifest.glob('*/*/*/*gold*conll')
+['gold/nw/wsj/00/wsj_0020.v4_gold_conll', 'gold/tc/ch/00/ch_0009.v4_gold_conll']
+
+An index file is only read if it was written for the same directory.  It is
+not checked against the directory, so delete it when gold files are added or
+renamed."""
+from __future__ import print_function, absolute_import
+import os
+import fnmatch
+from collections import defaultdict
+
+INDEX_HEADER = '# gold manifest: '
+
+_manifests = {}
+
+
+def gold_document_name(doc):
+	"""Document names in the Chinese telephone conversation data (tc/ch/00)
+	are renumbered in the gold files, e.g. ch_0001 is ch_0009."""
+	if "tc/ch/00/ch" in doc and '9' not in doc:
+		val = int(doc.split('_')[-1]) * 10 - 1
+		doc = "tc/ch/00/ch_%04d" % val
+	return doc
+
+
+class GoldManifest:
+	"""The CoNLL files under a directory, as paths relative to it."""
+
+	def __init__(self, directory, files):
+		self.directory = directory
+		self.by_dir = defaultdict(list)
+		for name in files:
+			path, base = name.rsplit('/', 1) if '/' in name else ('', name)
+			self.by_dir[path].append(base)
+		for names in self.by_dir.values():
+			names.sort()
+
+	@classmethod
+	def scan(cls, directory):
+		files = []
+		for root, _dirs, names in os.walk(directory, followlinks=True):
+			for name in names:
+				if name.endswith('conll'):
+					path = os.path.relpath(os.path.join(root, name), directory)
+					files.append(path.replace(os.sep, '/'))
+		return cls(directory, files)
+
+	@classmethod
+	def load(cls, directory, index_file):
+		"""Read an index file, returning None if it is for another directory."""
+		with open(index_file) as source:
+			header = source.readline().rstrip('\n')
+			if header != INDEX_HEADER + os.path.abspath(directory):
+				return None
+			return cls(directory, [line.rstrip('\n') for line in source])
+
+	def save(self, index_file):
+		with open(index_file, 'w') as out:
+			print(INDEX_HEADER + os.path.abspath(self.directory), file=out)
+			for path in sorted(self.by_dir):
+				for base in self.by_dir[path]:
+					print(self.relative(path, base), file=out)
+
+	def relative(self, path, base):
+		if path == '':
+			return base
+		return path + '/' + base
+
+	def full_path(self, path, base):
+		return os.path.join(self.directory, self.relative(path, base))
+
+	def matches(self, doc):
+		"""The gold files for a document: <doc>.conll if it exists, otherwise
+		<doc>*conll, narrowed to <doc>*gold*conll if there are several."""
+		doc = gold_document_name(doc)
+		path, prefix = doc.rsplit('/', 1) if '/' in doc else ('', doc)
+		names = self.by_dir.get(path, [])
+		if prefix + '.conll' in names:
+			return [self.full_path(path, prefix + '.conll')]
+		ans = [base for base in names if base.startswith(prefix)]
+		if len(ans) > 1:
+			ans = [base for base in ans
+					if fnmatch.fnmatchcase(base[len(prefix):], '*gold*conll')]
+		return [self.full_path(path, base) for base in ans]
+
+	def glob(self, pattern):
+		"""Files matching a glob pattern relative to the directory."""
+		parts = pattern.split('/')
+		ans = []
+		for path in sorted(self.by_dir):
+			dirs = path.split('/') if path != '' else []
+			if len(dirs) != len(parts) - 1:
+				continue
+			if not all(fnmatch.fnmatchcase(name, part)
+					for name, part in zip(dirs, parts)):
+				continue
+			for base in self.by_dir[path]:
+				if fnmatch.fnmatchcase(base, parts[-1]):
+					ans.append(self.full_path(path, base))
+		return ans
+
+
+def for_directory(directory, index_file=None):
+	"""The manifest for a directory, built once per run.  If index_file is
+	given it is loaded, or written after scanning if it does not exist or is
+	for another directory."""
+	if directory in _manifests:
+		return _manifests[directory]
+	manifest = None
+	if index_file is not None and os.path.exists(index_file):
+		manifest = GoldManifest.load(directory, index_file)
+	if manifest is None:
+		manifest = GoldManifest.scan(directory)
+		if index_file is not None:
+			manifest.save(index_file)
+	_manifests[directory] = manifest
+	return manifest
@@ -152,8 +152,8 @@ def last_search(tree, options, head_map):
 
 
 def collins_NP(tree, head_map):
-	for subtree in tree.subtrees:
-		collins_find_heads(subtree, head_map)
+	# The heads of the subtrees have already been found (see
+	# collins_find_heads)
 	# TODO: Extra special cases for NPs
 
 
@@ -182,56 +182,110 @@ def collins_NP(tree, head_map):
 	add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
 
 
+def compile_rules(rules):
+	"""Convert each rule's label list into a map from label to priority (the
+	order of first occurrence in the list), so one pass over the subtrees
+	finds the best match.
+
+	>>> compile_rules({'PP': [('left', ['IN', 'IN', 'TO'])]})
+	{'PP': [('left', {'IN': 0, 'TO': 1})]}
+	"""
+	ans = {}
+	for label, label_rules in rules.items():
+		ans[label] = []
+		for direction, labels in label_rules:
+			priority = {}
+			for option in labels:
+				priority.setdefault(option, len(priority))
+			ans[label].append((direction, priority))
+	return ans
+
+
+compiled_headrules = {lang: compile_rules(rules)
+		for lang, rules in headrules.items()}
+
+
+def rule_head(tree, rules, head_map):
+	"""Apply the head rules for a node: the first rule with a match picks
+	the subtree whose label, or the POS of whose head, comes first in the
+	rule's list (ignoring morphological features in square brackets, e.g.
+	N[soort,mv,basis] => N), nearest the rule's end of the node."""
+	# Normalised labels for the subtrees, computed once for all rules
+	candidates = []
+	for subtree in tree.subtrees:
+		head = get_head(head_map, subtree)
+		candidates.append((subtree.label.upper().split('[')[0],
+				head[2].split('[')[0], head))
+	for direction, priority in rules:
+		order = candidates
+		if direction == 'right':
+			order = reversed(candidates)
+		best = None
+		best_rank = len(priority)
+		for label, head_pos, head in order:
+			rank = min(priority.get(label, best_rank),
+					priority.get(head_pos, best_rank))
+			if rank < best_rank:
+				best = head
+				best_rank = rank
+				if rank == 0:
+					break
+		if best is not None:
+			return best
+	# Final fallback, the first or last subtree for the last rule
+	if rules[-1][0] == 'left':
+		return get_head(head_map, tree.subtrees[0])
+	return get_head(head_map, tree.subtrees[-1])
+
+
 def collins_find_heads(tree, head_map=None, lang=None):
+	"""Find the head of every node in the tree, using the Collins rules for
+	English and the Alpino rules for Dutch.  Nodes are visited in post-order
+	without recursion, so deep trees do not reach the recursion limit.
+
+	>>> from io import StringIO
+	>>> from nlp_util import treebanks
+	>>> tree = treebanks.ptb_read_tree(StringIO(
+	... 	'(S (NP (DT The) (NN man)) (VP (VBD saw) (NP (PRP it))))'))
+	>>> heads = collins_find_heads(tree)
+	>>> get_head(heads, tree)
+	((2, 3), 'saw', 'VBD')
+	>>> get_head(heads, tree.subtrees[0])
+	((1, 2), 'man', 'NN')
+	"""
 	if head_map is None:
 		head_map = {}
 	if lang is None:
 		lang = 'en'
-	mapping_table = headrules[lang]
-	for subtree in tree.subtrees:
-		collins_find_heads(subtree, head_map, lang)
-
-	# A word is it's own head
-	if tree.word is not None:
-		head = (tree.span, tree.word, tree.label)
-		add_head(head_map, tree, head)
-		return head_map
-
-	# If the label for this node is not in the table we are either at the bottom,
-	# at an NP, or have an error
-	if tree.label not in mapping_table:
-		if tree.label in ['NP', 'NML']:
-			collins_NP(tree, head_map)
+	mapping_table = compiled_headrules[lang]
+	stack = [(tree, False)]
+	while len(stack) > 0:
+		node, done = stack.pop()
+		if not done:
+			stack.append((node, True))
+			for subtree in reversed(node.subtrees):
+				stack.append((subtree, False))
+			continue
+
+		# A word is it's own head
+		if node.word is not None:
+			add_head(head_map, node, (node.span, node.word, node.label))
+
+		# If the label for this node is not in the table we are either at the
+		# bottom, at an NP, or have an error
+		elif node.label not in mapping_table:
+			if node.label in ['NP', 'NML']:
+				collins_NP(node, head_map)
+			else:
+				# TODO: Consider alternative error announcement means
+				# if node.label not in ['ROOT', 'TOP', 'S1', '']:
+				# 	print >> sys.stderr, "Unknown Label: %s" % node.label
+				# 	print >> sys.stderr, "In tree:", node.root()
+				add_head(head_map, node, get_head(head_map, node.subtrees[-1]))
+
 		else:
-			# TODO: Consider alternative error announcement means
-			# if tree.label not in ['ROOT', 'TOP', 'S1', '']:
-			# 	print >> sys.stderr, "Unknown Label: %s" % tree.label
-			# 	print >> sys.stderr, "In tree:", tree.root()
-			add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
-		return head_map
-
-	rules = mapping_table[tree.label.upper()]
-	# Try each rule for this label, until one matches
-	for info in rules:
-		# Look through and take the first/last occurrence that matches
-		for label in info[1]:
-			for i in range(len(tree.subtrees)):
-				if info[0] == 'right':
-					i = len(tree.subtrees) - i - 1
-				subtree = tree.subtrees[i]
-				# Split label on square brackets because the Dutch POS tags
-				# contain extra morphological features which are not part of
-				# the head rules: N[soort,mv,basis] => N
-				if (subtree.label.upper().split('[')[0] == label
-						or get_head(head_map, subtree)[2].split('[')[0] == label):
-					add_head(head_map, tree, get_head(head_map, subtree))
-					return head_map
-
-	# Final fallback
-	if info[0] == 'left':
-		add_head(head_map, tree, get_head(head_map, tree.subtrees[0]))
-	else:
-		add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
+			add_head(head_map, node, rule_head(node,
+					mapping_table[node.label.upper()], head_map))
 
 	return head_map
 
@@ -0,0 +1,217 @@
+"""CPU (cProfile) and memory (tracemalloc) profiling for --profile.
+
+A Profiler covers the process it is started in.  Worker processes run their
+own Profiler around each task and send back results(), which the parent adds
+in with merge(), so the report covers all of the work.  write() produces:
+
+  <prefix>.profile    a text report
+  <prefix>.callgrind  the same data in the callgrind format, for viewers such
+                      as KCachegrind or QCachegrind
+  <prefix>.pstats     (cpu only) the merged pstats data, for pstats or snakeviz
+
+Memory profiles list the memory that is still allocated when each profiler is
+stopped (at the end of a run, or of a task in a worker), by the line that
+allocated it, along with the largest peak seen in any process.
+
+The callgrind output gives each function its own time and the inclusive time
+of each call it makes:
+>>> stats = {('a.py', 1, 'f'): (1, 1, 0.5, 2.0, {}),
+... 		('a.py', 5, 'g'): (2, 2, 1.5, 1.5, {('a.py', 1, 'f'): (2, 2, 1.5, 1.5)})}
+>>> print('\\n'.join(callgrind_lines(stats)[5:]))
+fl=a.py
+fn=f a.py:1
+1 500000
+cfl=a.py
+cfn=g a.py:5
+calls=2 5
+1 1500000
+<BLANKLINE>
+fl=a.py
+fn=g a.py:5
+5 1500000
+<BLANKLINE>
+"""
+from __future__ import print_function, absolute_import
+import cProfile
+import linecache
+import os
+import pstats
+import tracemalloc
+from collections import defaultdict
+
+MODES = ['cpu', 'mem']
+REPORT_LINES = 40  # number of functions or source lines in the report
+
+_current = None
+
+
+class _LoadedStats:
+	"""Lets pstats.Stats load a stats dict sent back from a worker."""
+
+	def __init__(self, stats):
+		self.stats = stats
+
+	def create_stats(self):
+		pass
+
+
+class Profiler:
+	def __init__(self, mode):
+		if mode not in MODES:
+			raise ValueError("Unknown profile mode: %s" % mode)
+		self.mode = mode
+		self.profile = None
+		self.stats = pstats.Stats()
+		self.lines = defaultdict(lambda: [0, 0])
+		self.peak = 0
+
+	def start(self):
+		global _current
+		if self.mode == 'cpu':
+			self.profile = cProfile.Profile()
+			self.profile.enable()
+		else:
+			tracemalloc.start()
+		_current = self
+
+	def stop(self):
+		"""Stop profiling, keeping the results."""
+		global _current
+		if self.mode == 'cpu':
+			self.profile.disable()
+			self.profile.create_stats()
+			self.merge({'mode': 'cpu', 'stats': self.profile.stats})
+			self.profile = None
+		else:
+			peak = tracemalloc.get_traced_memory()[1]
+			snapshot = tracemalloc.take_snapshot().filter_traces([
+					tracemalloc.Filter(False, tracemalloc.__file__)])
+			tracemalloc.stop()
+			lines = []
+			for stat in snapshot.statistics('lineno'):
+				frame = stat.traceback[0]
+				lines.append((frame.filename, frame.lineno, stat.size, stat.count))
+			self.merge({'mode': 'mem', 'lines': lines, 'peak': peak})
+		_current = None
+
+	def discard(self):
+		"""Stop profiling without keeping anything (used in a forked worker,
+		which starts out with a copy of the parent's profiler running)."""
+		global _current
+		if self.mode == 'cpu':
+			self.profile.disable()
+		else:
+			tracemalloc.stop()
+		_current = None
+
+	def results(self):
+		"""Everything recorded so far, in a form that can be pickled."""
+		if self.mode == 'cpu':
+			return {'mode': 'cpu', 'stats': self.stats.stats}
+		lines = [key + tuple(value) for key, value in self.lines.items()]
+		return {'mode': 'mem', 'lines': lines, 'peak': self.peak}
+
+	def merge(self, results):
+		if self.mode == 'cpu':
+			if len(results['stats']) > 0:
+				self.stats.add(_LoadedStats(results['stats']))
+		else:
+			for filename, lineno, size, count in results['lines']:
+				self.lines[filename, lineno][0] += size
+				self.lines[filename, lineno][1] += count
+			self.peak = max(self.peak, results['peak'])
+
+	def write(self, prefix):
+		with open(prefix + '.profile', 'w') as out:
+			if self.mode == 'cpu':
+				self.stats.stream = out
+				print("Sorted by cumulative time", file=out)
+				self.stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+				print("Sorted by own time", file=out)
+				self.stats.sort_stats('tottime').print_stats(REPORT_LINES)
+			else:
+				self.print_memory(out)
+		with open(prefix + '.callgrind', 'w') as out:
+			if self.mode == 'cpu':
+				lines = callgrind_lines(self.stats.stats)
+			else:
+				lines = memory_callgrind_lines(self.lines)
+			print('\n'.join(lines), file=out)
+		if self.mode == 'cpu':
+			self.stats.dump_stats(prefix + '.pstats')
+
+	def print_memory(self, out):
+		total = sum(size for size, _count in self.lines.values())
+		print("Peak traced memory (largest of the processes): %.1f MiB" %
+				(self.peak / 1048576.0), file=out)
+		print("Memory allocated at the end of profiling: %.1f MiB" %
+				(total / 1048576.0), file=out)
+		print(file=out)
+		print("{:>12} {:>10}  {}".format('KiB', 'blocks', 'line'), file=out)
+		ranked = sorted(self.lines.items(), key=lambda item: -item[1][0])
+		for (filename, lineno), (size, count) in ranked[:REPORT_LINES]:
+			print("{:12.1f} {:10d}  {}:{}".format(size / 1024.0, count,
+					filename, lineno), file=out)
+			source = linecache.getline(filename, lineno).strip()
+			if source:
+				print("{:24}{}".format('', source), file=out)
+
+
+def start(mode):
+	profiler = Profiler(mode)
+	profiler.start()
+	return profiler
+
+
+def worker_init():
+	"""Pool initializer, discards a profiler inherited from the parent."""
+	if _current is not None:
+		_current.discard()
+
+
+def function_label(func):
+	filename, line, name = func
+	if filename == '~':
+		return name
+	return '%s %s:%d' % (name, os.path.basename(filename), line)
+
+
+def callgrind_lines(stats):
+	"""Convert pstats data, {(file, line, name): (primitive calls, calls, own
+	time, cumulative time, {caller: (calls, primitive calls, own time,
+	cumulative time)})}, into lines of a callgrind file."""
+	callees = defaultdict(list)
+	for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+		for caller, edge in callers.items():
+			callees[caller].append((func, edge))
+	lines = ['# callgrind format', 'version: 1', 'creator: nlp_util.profiling',
+			'events: Microseconds', '']
+	for func in sorted(stats):
+		filename, line, _name = func
+		lines.append('fl=%s' % filename)
+		lines.append('fn=%s' % function_label(func))
+		lines.append('%d %d' % (line, round(stats[func][2] * 1e6)))
+		for callee, edge in sorted(callees[func]):
+			lines.append('cfl=%s' % callee[0])
+			lines.append('cfn=%s' % function_label(callee))
+			lines.append('calls=%d %d' % (edge[0], callee[1]))
+			lines.append('%d %d' % (line, round(edge[3] * 1e6)))
+		lines.append('')
+	return lines
+
+
+def memory_callgrind_lines(memory):
+	"""Lines of a callgrind file giving the memory allocated by each source
+	line, grouped by file."""
+	lines = ['# callgrind format', 'version: 1', 'creator: nlp_util.profiling',
+			'events: Bytes Blocks', '']
+	by_file = defaultdict(list)
+	for (filename, lineno), (size, count) in memory.items():
+		by_file[filename].append((lineno, size, count))
+	for filename in sorted(by_file):
+		lines.append('fl=%s' % filename)
+		lines.append('fn=%s' % os.path.basename(filename))
+		for lineno, size, count in sorted(by_file[filename]):
+			lines.append('%d %d %d' % (lineno, size, count))
+		lines.append('')
+	return lines
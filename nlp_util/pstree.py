@@ -1,4 +1,5 @@
 from __future__ import print_function, absolute_import
+import sys
 from collections import defaultdict
 
 DEFAULT_LABEL = 'label_not_set'
@@ -83,6 +84,9 @@ class PSTree:
 	'was named *-1 a nonexecutive director of this British industrial conglomerate'
 	"""
 
+	# Large treebanks have millions of nodes, so avoid a __dict__ per node
+	__slots__ = ('word', 'label', 'span', 'parent', 'subtrees')
+
 	def __init__(self,
 			word=None,
 			label=DEFAULT_LABEL,
@@ -218,6 +222,29 @@ class PSTree:
 		node_dict[(self.label, self.span[0], self.span[1])].append(depth)
 		return node_dict
 
+	def build_span_index(self):
+		"""Return a map from each span in this tree to its nodes, from the
+		lowest up, so that 'lowest' and 'highest' requests for an exact span can
+		be answered with a dictionary lookup rather than get_nodes.  The map is
+		not updated when the tree is modified.
+
+		>>> tree = tree_from_text("(ROOT (S (NP (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti)))))")
+		>>> index = tree.build_span_index()
+		>>> index[(3, 4)]
+		[(NNP Elianti), (NP (NNP Elianti))]
+		>>> index[(0, 4)][0] is tree.get_nodes('lowest', 0, 4)
+		True
+		"""
+		index = {}
+		for node in self:
+			if node.span in index:
+				index[node.span].append(node)
+			else:
+				index[node.span] = [node]
+		for nodes in index.values():
+			nodes.reverse()
+		return index
+
 	def get_nodes(self, request='all', start=-1, end=-1, node_list=None):
 		"""Get the node(s) that have a given span.  Unspecified endpoints are
 		treated as wildcards.  The request can be 'lowest', 'highest', or 'all'.
@@ -303,7 +330,7 @@ def tree_from_text(text, allow_empty_labels=False, allow_empty_words=False):
 			if cur.label is DEFAULT_LABEL:
 				if len(word) == 0 and not allow_empty_labels:
 					raise Exception("Empty label found\n%s" % text)
-				cur.label = word
+				cur.label = sys.intern(word)
 				word = ''
 			if word != '':
 				raise Exception("Stray '%s' while processing\n%s" %
@@ -328,7 +355,7 @@ def tree_from_text(text, allow_empty_labels=False, allow_empty_words=False):
 			if cur.label is DEFAULT_LABEL:
 				if len(word) == 0 and not allow_empty_labels:
 					raise Exception("Empty label found\n%s" % text)
-				cur.label = word
+				cur.label = sys.intern(word)
 				word = ''
 			else:
 				word += char
@@ -339,6 +366,49 @@ def tree_from_text(text, allow_empty_labels=False, allow_empty_words=False):
 	return root
 
 
+def tree_to_tuples(tree):
+	"""Flatten a tree into a pre-order list of (label, word, subtree count)
+	tuples, a compact form that can be stored and rebuilt without parsing.
+
+	>>> tree = tree_from_text("(ROOT (NP (NNP Ms.) (NNP Haag)))")
+	>>> tree_to_tuples(tree)
+	[('ROOT', None, 1), ('NP', None, 2), ('NNP', 'Ms.', 0), ('NNP', 'Haag', 0)]
+	"""
+	return [(node.label, node.word, len(node.subtrees)) for node in tree]
+
+
+def tree_from_tuples(nodes):
+	"""Rebuild a tree from the output of tree_to_tuples, recalculating spans.
+
+	>>> tree = tree_from_text("(ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag) ) (VP (VBZ plays) (NP (NNP Elianti) )) (. .) ))")
+	>>> ntree = tree_from_tuples(tree_to_tuples(tree))
+	>>> print(ntree)
+	(ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))
+	>>> [node.span for node in ntree] == [node.span for node in tree]
+	True
+	"""
+	root = None
+	stack = []  # [node, number of subtrees still to be added]
+	pos = 0
+	for label, word, count in nodes:
+		node = PSTree(word, sys.intern(label))
+		if len(stack) == 0:
+			root = node
+		else:
+			node.parent = stack[-1][0]
+			node.parent.subtrees.append(node)
+			stack[-1][1] -= 1
+		if count > 0:
+			stack.append([node, count])
+			continue
+		node.span = (pos, pos + 1)
+		pos += 1
+		while len(stack) > 0 and stack[-1][1] == 0:
+			done = stack.pop()[0]
+			done.span = (done.subtrees[0].span[0], done.subtrees[-1].span[1])
+	return root
+
+
 def clone_and_find(nodes):
 	"""Clone the tree these nodes are in and finds the equivalent nodes in the
 	new tree."""
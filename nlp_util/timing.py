@@ -0,0 +1,193 @@
+"""Optional timing and counters for a run, written as JSON with --stats.
+
+Recording is off unless enable() is called.  While it is off, stage() and
+document() return a shared context manager that does nothing and count()
+returns straight away, so instrumented code costs one function call per use.
+
+Wall and CPU time are recorded for each stage.  Times are exclusive, time
+spent in a nested stage is not counted for the stage around it, so the stages
+add up to the total.
+
+>>> recorder = enable()
+>>> with stage('outer'):
+... 	with stage('inner'):
+... 		count('things', 2)
+>>> sorted(recorder.wall), recorder.calls['inner'], recorder.counts['things']
+(['inner', 'outer'], 1, 2)
+>>> with document('doc', '000'):
+... 	pass
+>>> [entry['document'] for entry in recorder.as_dict()['slowest_documents']]
+['doc']
+>>> disable()
+>>> with stage('outer'):
+... 	count('things')
+>>> recorder.calls['outer'], recorder.counts['things']
+(1, 2)
+"""
+from __future__ import print_function, absolute_import
+import heapq
+import json
+import sys
+import time
+from collections import defaultdict
+
+SLOWEST = 10  # number of documents listed in the report
+
+_recorder = None
+
+
+class _NullStage:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+	def __init__(self, recorder, name):
+		self.recorder = recorder
+		self.name = name
+
+	def __enter__(self):
+		self.child_wall = 0.0
+		self.child_cpu = 0.0
+		self.recorder.active.append(self)
+		self.wall_start = time.perf_counter()
+		self.cpu_start = time.process_time()
+		return self
+
+	def __exit__(self, *exc):
+		wall = time.perf_counter() - self.wall_start
+		cpu = time.process_time() - self.cpu_start
+		recorder = self.recorder
+		recorder.active.pop()
+		recorder.wall[self.name] += wall - self.child_wall
+		recorder.cpu[self.name] += cpu - self.child_cpu
+		recorder.calls[self.name] += 1
+		if len(recorder.active) > 0:
+			recorder.active[-1].child_wall += wall
+			recorder.active[-1].child_cpu += cpu
+		return False
+
+
+class _Document:
+	def __init__(self, recorder, doc, part):
+		self.recorder = recorder
+		self.key = (doc, part)
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.recorder.add_document(self.key[0], self.key[1],
+				time.perf_counter() - self.start)
+		return False
+
+
+class Recorder:
+	def __init__(self):
+		self.wall = defaultdict(float)
+		self.cpu = defaultdict(float)
+		self.calls = defaultdict(int)
+		self.counts = defaultdict(int)
+		self.slowest = []  # min-heap of (seconds, doc, part)
+		self.active = []  # stack of open stages
+		self.wall_start = time.perf_counter()
+		self.cpu_start = time.process_time()
+
+	def add_document(self, doc, part, seconds):
+		entry = (seconds, doc, part)
+		if len(self.slowest) < SLOWEST:
+			heapq.heappush(self.slowest, entry)
+		elif entry > self.slowest[0]:
+			heapq.heapreplace(self.slowest, entry)
+
+	def as_dict(self):
+		return {
+				'wall_seconds': dict(self.wall),
+				'cpu_seconds': dict(self.cpu),
+				'calls': dict(self.calls),
+				'counts': dict(self.counts),
+				'slowest_documents': [
+					{'document': doc, 'part': part, 'seconds': seconds}
+					for seconds, doc, part in sorted(self.slowest, reverse=True)
+				],
+		}
+
+	def merge(self, data):
+		"""Add in the as_dict() results from another recorder, e.g. one in a
+		worker process."""
+		for name, table in [('wall_seconds', self.wall),
+				('cpu_seconds', self.cpu), ('calls', self.calls),
+				('counts', self.counts)]:
+			for key, value in data[name].items():
+				table[key] += value
+		for entry in data['slowest_documents']:
+			self.add_document(entry['document'], entry['part'], entry['seconds'])
+
+
+def enable():
+	"""Start recording (discarding anything recorded so far)."""
+	global _recorder
+	_recorder = Recorder()
+	return _recorder
+
+
+def disable():
+	global _recorder
+	_recorder = None
+
+
+def enabled():
+	return _recorder is not None
+
+
+def recorder():
+	return _recorder
+
+
+def stage(name):
+	if _recorder is None:
+		return _NULL_STAGE
+	return _Stage(_recorder, name)
+
+
+def document(doc, part):
+	"""Time the processing of one document part, for the slowest list."""
+	if _recorder is None:
+		return _NULL_STAGE
+	return _Document(_recorder, doc, part)
+
+
+def count(name, value=1):
+	if _recorder is not None:
+		_recorder.counts[name] += value
+
+
+def timed(name, iterable):
+	"""Iterate, counting the time spent producing each item towards a stage,
+	e.g. reading parts from a generator."""
+	iterator = iter(iterable)
+	while True:
+		with stage(name):
+			try:
+				item = next(iterator)
+			except StopIteration:
+				return
+		yield item
+
+
+def write(filename, args=sys.argv):
+	"""Write everything recorded as JSON, with totals for the whole run."""
+	data = _recorder.as_dict()
+	data['command'] = list(args)
+	data['total_wall_seconds'] = time.perf_counter() - _recorder.wall_start
+	data['total_cpu_seconds'] = time.process_time() - _recorder.cpu_start
+	with open(filename, 'w') as out:
+		json.dump(data, out, indent=2, sort_keys=True)
+		print(file=out)
@@ -1,4 +1,6 @@
 from __future__ import print_function, absolute_import
+import re
+import sys
 from nlp_util.pstree import PSTree, tree_from_text
 
 # TODO: Handle malformed input with trees that have random stuff instead
@@ -245,6 +247,91 @@ def homogenise_tree(tree, tag_set=ptb_tag_set):
 	return tree
 
 
+BRACKET_RE = re.compile('[()]')
+
+
+class PTBReader:
+	"""Reads trees one at a time from a PTB file, keeping the text read
+	beyond the end of each tree for the next one (the source should not be
+	read by other code in between)."""
+
+	def __init__(self, source):
+		self.source = source
+		self.pending = ''
+
+	def read_tree(self,
+			return_empty=False,
+			allow_empty_labels=False,
+			allow_empty_words=False,
+			blank_line_coverage=False):
+		"""See ptb_read_tree."""
+		source = self.source
+		text = self.pending
+		self.pending = ''
+		start = 0  # where the text for the current tree begins
+		pos = 0  # how far the text has been scanned
+		depth = 0
+		opened = False
+		empty = False
+		while True:
+			# A blank line before anything else (ie. two whitespace characters,
+			# the second a newline)
+			if blank_line_coverage and pos == start:
+				while len(text) - start < 2:
+					line = source.readline()
+					if line == '':
+						break
+					text += line
+				if (len(text) - start >= 2 and text[start] in ' \n\t'
+						and text[start + 1] == '\n'):
+					self.pending = text[start + 2:]
+					return "Empty"
+
+			match = BRACKET_RE.search(text, pos)
+			if match is None:
+				line = source.readline()
+				if line == '':
+					return None
+				pos = len(text)
+				text += line
+				closing = line.count(')')
+				if closing < depth:
+					# The tree cannot be completed on this line, so skip
+					# scanning it
+					depth += line.count('(') - closing
+					# (including the end of the previous text, which matters
+					# when reading a character at a time)
+					if '()' in text[max(start, pos - 1):]:
+						empty = True
+					pos = len(text)
+				continue
+			pos = match.end()
+			if match.group() == '(':
+				depth += 1
+				opened = True
+			else:
+				depth -= 1
+				if pos - 2 >= start and text[pos - 2] == '(':
+					empty = True
+			if depth == 0:
+				if empty:
+					if return_empty:
+						self.pending = text[pos:]
+						return "Empty"
+					start = pos
+					opened = False
+					empty = False
+					continue
+				if opened:
+					break
+
+		self.pending = text[pos:]
+		cur_text = text[start:pos].replace('\n', ' ').replace('\t', ' ')
+		tree = tree_from_text(cur_text, allow_empty_labels, allow_empty_words)
+		ptb_cleaning(tree)
+		return tree
+
+
 def ptb_read_tree(source,
 		return_empty=False,
 		allow_empty_labels=False,
@@ -252,8 +339,13 @@ def ptb_read_tree(source,
 		blank_line_coverage=False):
 	"""Read a single tree from the given PTB file.
 
-	The function reads a character at a time, stopping as soon as a tree can be
-	constructed, so multiple trees on a sinlge line are manageable.
+	The file is read a line at a time, tracking bracket depth, and reading
+	stops as soon as a tree can be constructed.  The file is left just after
+	the end of the tree, so multiple trees on a single line are manageable: a
+	seekable file is moved back over any text read beyond the tree, other
+	files are read a character at a time.  When reading many trees, passing a
+	PTBReader for the file (as generate_trees does) avoids this, as it keeps
+	the text beyond each tree for the next.
 
 	>>> from io import StringIO
 	>>> file_text = '''(ROOT (S
@@ -266,37 +358,70 @@ def ptb_read_tree(source,
 	...   (. .) ))'''
 	>>> in_file = StringIO(file_text)
 	>>> ptb_read_tree(in_file)
-	(ROOT (S (NP-SBJ (NNP Scotty)) (VP (VBD did) (RB not) (VP (VB go) (ADVP (RB back)) (PP (TO to) (NP (NN school))))) (. .)))"""
-	cur_text = ''
-	depth = 0
-	while True:
-		char = source.read(1)
-		if char == '':
-			return None
-			break
-		if char == '\n' and cur_text == ' ' and blank_line_coverage:
-			return "Empty"
-		if char in '\n\t':
-			char = ' '
-		cur_text += char
-		if char == '(':
-			depth += 1
-		elif char == ')':
-			depth -= 1
-		if depth == 0:
-			if '()' in cur_text:
-				if return_empty:
-					return "Empty"
-				cur_text = ''
-				continue
-			if '(' in cur_text:
-				break
-
-	tree = tree_from_text(cur_text, allow_empty_labels, allow_empty_words)
-	ptb_cleaning(tree)
+	(ROOT (S (NP-SBJ (NNP Scotty)) (VP (VBD did) (RB not) (VP (VB go) (ADVP (RB back)) (PP (TO to) (NP (NN school))))) (. .)))
+	>>> text = "(A (B x)) (C (D y))\\n\\n()\\n(E (F z))\\n"
+	>>> in_file = StringIO(text)
+	>>> ptb_read_tree(in_file), ptb_read_tree(in_file)
+	((A (B x)), (C (D y)))
+	>>> ptb_read_tree(in_file, blank_line_coverage=True)
+	'Empty'
+	>>> ptb_read_tree(in_file, return_empty=True)
+	'Empty'
+	>>> ptb_read_tree(in_file), ptb_read_tree(in_file)
+	((E (F z)), None)
+
+	The same for a file that cannot seek, and for a PTBReader:
+	>>> class Unseekable(StringIO):
+	... 	def seekable(self):
+	... 		return False
+	>>> for source in [Unseekable(text), PTBReader(StringIO(text))]:
+	... 	print([str(ptb_read_tree(source, return_empty=True))
+	... 			for _ in range(5)])
+	['(A (B x))', '(C (D y))', 'Empty', '(E (F z))', 'None']
+	['(A (B x))', '(C (D y))', 'Empty', '(E (F z))', 'None']"""
+	if isinstance(source, PTBReader):
+		return source.read_tree(return_empty, allow_empty_labels,
+				allow_empty_words, blank_line_coverage)
+	if source.seekable():
+		lines = _MarkedLines(source)
+	else:
+		lines = _Characters(source)
+	reader = PTBReader(lines)
+	tree = reader.read_tree(return_empty, allow_empty_labels,
+			allow_empty_words, blank_line_coverage)
+	if len(reader.pending) > 0:
+		# Go back to just after the tree (the unused text is always from the
+		# last line read)
+		source.seek(lines.mark)
+		source.read(len(lines.last) - len(reader.pending))
 	return tree
 
 
+class _MarkedLines:
+	"""Reads lines from a seekable file, noting where the last one began."""
+
+	def __init__(self, source):
+		self.source = source
+		self.mark = None
+		self.last = ''
+
+	def readline(self):
+		self.mark = self.source.tell()
+		self.last = self.source.readline()
+		return self.last
+
+
+class _Characters:
+	"""Reads a file a character at a time, so nothing beyond the end of a
+	tree is read."""
+
+	def __init__(self, source):
+		self.source = source
+
+	def readline(self):
+		return self.source.read(1)
+
+
 CONLL_EXAMPLE = """#begin document (nw/wsj/00/wsj_0020)
 nw/wsj/00/wsj_0020   0    0         They    PRP    (TOP(S(NP*)        -    -   -   -            *        (ARG1*)          *    (0)
 nw/wsj/00/wsj_0020   0    1         will     MD          (VP*         -    -   -   -            *    (ARGM-MOD*)          *     -
@@ -341,21 +466,65 @@ def conll_read_tree(source,
 			break
 		cur_text.append(line)
 
-	text = ''
+	rows = []
 	for line in cur_text:
 		if len(line) == 0 or line[0] == '#':
 			continue
 		line = line.split()
-		# escape parentheses to avoid malformed trees
-		word = line[3].replace('(', '-LRB-').replace(')', '-LRB-')
 		try:
-			pos = line[4].replace('(', '[').replace(')', ']')
+			rows.append((line[3], line[4], line[5]))
 		except IndexError:
 			raise ValueError('conll file does not contain a POS tag column.')
-		tree = line[5]
-		tree = tree.split('*')
-		text += '%s(%s %s)%s' % (tree[0], pos, word, tree[1])
-	return tree_from_text(text)
+	return conll_tree_from_rows(rows)
+
+
+def conll_tree_from_rows(rows):
+	"""Build a tree from the (word, POS, parse bit) columns of the lines for a
+	sentence.  Nodes are created directly from the parse bits, e.g. '(NP(NN*'
+	and '*))', rather than by assembling and re-reading a bracketed string.
+
+	>>> rows = [('The', 'DT', '(TOP(NP*'), ('man', 'NN', '*)'), ('.', '.', '*)')]
+	>>> tree = conll_tree_from_rows(rows)
+	>>> print(tree)
+	(TOP (NP (DT The) (NN man)) (. .))
+	>>> [node.span for node in tree]
+	[(0, 3), (0, 2), (0, 1), (1, 2), (2, 3)]
+	"""
+	root = None
+	cur = None
+	pos = 0
+	for word, tag, bit in rows:
+		opening, _, closing = bit.partition('*')
+		if opening:
+			for label in opening.split('(')[1:]:
+				if len(label) == 0:
+					raise Exception("Empty label found\n%s" % bit)
+				node = PSTree(None, sys.intern(label), (0, 0), cur)
+				if cur is not None:
+					cur.subtrees.append(node)
+				elif root is None:
+					root = node
+				else:
+					raise Exception("Multiple trees found in sentence")
+				cur = node
+		if cur is None:
+			raise Exception("Word outside of the tree\n%s" % bit)
+		# escape parentheses to avoid malformed trees
+		if '(' in word or ')' in word:
+			word = word.replace('(', '-LRB-').replace(')', '-LRB-')
+		if '(' in tag or ')' in tag:
+			tag = tag.replace('(', '[').replace(')', ']')
+		cur.subtrees.append(PSTree(word, sys.intern(tag), (pos, pos + 1), cur))
+		pos += 1
+		if closing:
+			for _ in range(closing.count(')')):
+				if cur is None:
+					raise Exception("Too many closing brackets\n%s" % bit)
+				cur.span = (cur.subtrees[0].span[0], pos)
+				cur = cur.parent
+	if cur is not None or root is None:
+		raise Exception("Text did not include complete tree")
+	return root
 
 
 def generate_trees(source,
@@ -389,6 +558,9 @@ def generate_trees(source,
 	(ROOT (S (NP-SBJ (DT The) (NN bandit)) (VP (VBZ laughs) (PP (IN in) (NP (PRP$ his) (NN face)))) (. .)))"""
 	if isinstance(source, str):
 		source = open(source)
+	if tree_reader is ptb_read_tree:
+		# Keep text after the end of each tree for the next
+		source = PTBReader(source)
 	count = 0
 	while True:
 		tree = tree_reader(source, return_empty, allow_empty_labels,
@@ -5,34 +5,91 @@ from __future__ import print_function, absolute_import
 import sys
 import getopt
 from nlp_util import (coreference_reading, coreference_rendering, coreference,
-		init, head_finder)
+		init, head_finder, conll_cache, buffered_output, timing, profiling,
+		gold_manifest, conll_index)
+
+OUTPUT_FILES = [
+		('cluster_errors', '.cluster_errors'),
+		('cluster_context', '.cluster_context'),
+		('cluster_missing', '.cluster_missing'),
+		('cluster_extra', '.cluster_extra'),
+		('mention_list', '.mention_list'),
+		('mention_text', '.mention_text'),
+]
 
 
 def main():
 	try:
 		opts, args = getopt.gnu_getopt(sys.argv[1:], '',
-				['resolvespanerrors', 'lang='])
+				['resolvespanerrors', 'lang=', 'stream', 'cache=',
+				'cachesize=', 'outputs=', 'stats=', 'profile=', 'goldindex=',
+				'documents='])
 		output_prefix, gold_dir, test_file = args
+		opts = dict(opts)
+		outputs = set(name for name, _suffix in OUTPUT_FILES)
+		if '--outputs' in opts:
+			outputs = buffered_output.select_outputs(opts['--outputs'],
+					OUTPUT_FILES)
+		profile = opts.get('--profile')
+		if profile is not None and profile not in profiling.MODES:
+			raise ValueError(profile)
+		cache = conll_cache.from_options(opts)
 	except (getopt.GetoptError, ValueError):
 		print('Print coreference resolution errors')
 		print(('./%s <prefix> <gold_dir> <test_file> '
-				'[--resolvespanerrors] [--lang=<en|nl>]' % sys.argv[0]))
+				'[--resolvespanerrors] [--lang=<en|nl>] [--stream] '
+				'[--cache=<dir>] [--cachesize=<MB>] [--outputs=<suffix,...>] '
+				'[--stats=<file>] [--profile=<cpu|mem>] '
+				'[--goldindex=<file>] '
+				'[--documents=<pattern,...>]' % sys.argv[0]))
 		return
-	opts = dict(opts)
+	if '--stats' in opts:
+		timing.enable()
+	profiler = None
+	if profile is not None:
+		profiler = profiling.start(profile)
 	lang = opts.get('--lang', 'en')
-	auto = coreference_reading.read_conll_coref_system_output(test_file)
-	gold = coreference_reading.read_conll_matching_files(auto, gold_dir, lang)
-
-	out_cluster_errors = open(output_prefix + '.cluster_errors', 'w')
-	out_cluster_context = open(output_prefix + '.cluster_context', 'w')
-	out_cluster_missing = open(output_prefix + '.cluster_missing', 'w')
-	out_cluster_extra = open(output_prefix + '.cluster_extra', 'w')
-	out_mention_list = open(output_prefix + '.mention_list', 'w')
-	out_mention_text = open(output_prefix + '.mention_text', 'w')
+	if '--goldindex' in opts:
+		gold_manifest.for_directory(gold_dir, opts['--goldindex'])
+	# Only read the parts for the selected documents
+	select = None
+	if '--documents' in opts:
+		select = conll_index.document_filter(opts['--documents'])
+	if '--stream' in opts:
+		# Pair parts up as they are read, rather than loading everything
+		system_parts = coreference_reading.generate_conll_coref_system_output(
+				test_file, select)
+		parts = coreference_reading.generate_conll_matching_parts(
+				system_parts, gold_dir, lang, cache)
+	else:
+		with timing.stage('read'):
+			auto = coreference_reading.read_conll_coref_system_output(
+					test_file, select=select)
+			gold = coreference_reading.read_conll_matching_files(auto,
+					gold_dir, lang, cache, select is not None)
+		parts = coreference_reading.sorted_matching_parts(auto, gold)
+	if timing.enabled():
+		parts = timing.timed('read', parts)
+
+	files = {}
+	for name, suffix in OUTPUT_FILES:
+		if name in outputs:
+			files[name] = open(output_prefix + suffix, 'w')
+		else:
+			files[name] = buffered_output.NullFile()
+	out_cluster_errors = files['cluster_errors']
+	out_cluster_context = files['cluster_context']
+	out_cluster_missing = files['cluster_missing']
+	out_cluster_extra = files['cluster_extra']
+	out_mention_list = files['mention_list']
+	out_mention_text = files['mention_text']
 	out_files = [
 			out_cluster_errors, out_cluster_context, out_cluster_missing,
 			out_cluster_extra, out_mention_list, out_mention_text
 	]
+	# The four cluster files are produced together
+	cluster_output = len(outputs.difference(['mention_list',
+			'mention_text'])) > 0
 	for out in out_files:
 		init.header(sys.argv, out)
 
@@ -48,71 +105,86 @@ def main():
 		instructions = ['# ' + inst for inst in instructions]
 		print('\n'.join(instructions), file=outfile)
 
-	# Define an order
-	order = []
-	for doc in auto:
-		for part in auto[doc]:
-			order.append((doc, part))
-	order.sort()
-
-	for doc, part in order:
-		# Setup
-		for out in out_files:
-			print("\n# %s %s\n" % (doc, part), file=out)
-
-		text = gold[doc][part]['text']
-
-		gold_parses = gold[doc][part]['parses']
-		gold_heads = gold[doc][part]['heads']
-		gold_mentions = gold[doc][part]['mentions']
-		gold_clusters = gold[doc][part]['clusters']
-
-		auto_mentions = auto[doc][part]['mentions']
-		auto_clusters = auto[doc][part]['clusters']
-
-		gold_cluster_set = coreference.set_of_clusters(gold_clusters)
-		auto_cluster_set = coreference.set_of_clusters(auto_clusters)
-		gold_mention_set = coreference.set_of_mentions(gold_clusters)
-		auto_mention_set = coreference.set_of_mentions(auto_clusters)
-
-		if '--resolvespanerrors' in opts:
-			coreference_rendering.match_boundaries(gold_mention_set,
-					auto_mention_set,
-					auto_mentions,
-					auto_clusters,
-					auto_cluster_set, text,
-					gold_parses, gold_heads)
-
-		# Coloured mention output
-		coreference_rendering.print_mention_list(out_mention_list,
-				gold_mentions,
-				auto_mention_set, gold_parses,
-				gold_heads, text)
-		coreference_rendering.print_mention_text(out_mention_text,
-				gold_mentions,
-				auto_mention_set, gold_parses,
-				gold_heads, text)
-
-		# Coloured cluster output, grouped
-		groups = coreference.confusion_groups(gold_mentions, auto_mentions,
-				gold_clusters, auto_clusters)
-
-		covered = coreference_rendering.print_cluster_errors(
-				groups, out_cluster_errors, out_cluster_context, text,
-				gold_parses, gold_heads, auto_clusters, gold_clusters,
-				gold_mentions)
-		print("Entirely missing or extra\n", file=out_cluster_errors)
-		print("Entirely missing or extra\n", file=out_cluster_context)
-		coreference_rendering.print_cluster_missing(out_cluster_errors,
-				out_cluster_context,
-				out_cluster_missing, text,
-				gold_cluster_set, covered,
-				gold_parses, gold_heads)
-		coreference_rendering.print_cluster_extra(out_cluster_errors,
-				out_cluster_context,
-				out_cluster_extra, text,
-				auto_cluster_set, covered,
-				gold_parses, gold_heads)
+	for doc, part, gold_doc, auto_doc in parts:
+		with timing.document(doc, part):
+			# Setup
+			for out in out_files:
+				print("\n# %s %s\n" % (doc, part), file=out)
+
+			text = gold_doc['text']
+
+			gold_parses = gold_doc['parses']
+			gold_heads = gold_doc['heads']
+			gold_mentions = gold_doc['mentions']
+			gold_clusters = gold_doc['clusters']
+
+			auto_mentions = auto_doc['mentions']
+			auto_clusters = auto_doc['clusters']
+
+			gold_cluster_set = coreference.set_of_clusters(gold_clusters)
+			auto_cluster_set = coreference.set_of_clusters(auto_clusters)
+			gold_mention_set = coreference.set_of_mentions(gold_clusters)
+			auto_mention_set = coreference.set_of_mentions(auto_clusters)
+			timing.count('documents')
+			timing.count('gold mentions', len(gold_mentions))
+			timing.count('system mentions', len(auto_mentions))
+
+			if '--resolvespanerrors' in opts:
+				with timing.stage('match_boundaries'):
+					coreference_rendering.match_boundaries(gold_mention_set,
+							auto_mention_set,
+							auto_mentions,
+							auto_clusters,
+							auto_cluster_set, text,
+							gold_parses, gold_heads)
+
+			# Coloured mention output
+			with timing.stage('render'):
+				if 'mention_list' in outputs:
+					coreference_rendering.print_mention_list(out_mention_list,
+							gold_mentions,
+							auto_mention_set, gold_parses,
+							gold_heads, text)
+				if 'mention_text' in outputs:
+					coreference_rendering.print_mention_text(out_mention_text,
+							gold_mentions,
+							auto_mention_set, gold_parses,
+							gold_heads, text)
+
+			if not cluster_output:
+				continue
+
+			# Coloured cluster output, grouped
+			groups = coreference.confusion_groups(gold_mentions, auto_mentions,
+					gold_clusters, auto_clusters)
+			timing.count('confusion groups', len(groups))
+
+			with timing.stage('render'):
+				covered = coreference_rendering.print_cluster_errors(
+						groups, out_cluster_errors, out_cluster_context, text,
+						gold_parses, gold_heads, auto_clusters, gold_clusters,
+						gold_mentions)
+				print("Entirely missing or extra\n", file=out_cluster_errors)
+				print("Entirely missing or extra\n", file=out_cluster_context)
+				coreference_rendering.print_cluster_missing(out_cluster_errors,
+						out_cluster_context,
+						out_cluster_missing, text,
+						gold_cluster_set, covered,
+						gold_parses, gold_heads)
+				coreference_rendering.print_cluster_extra(out_cluster_errors,
+						out_cluster_context,
+						out_cluster_extra, text,
+						auto_cluster_set, covered,
+						gold_parses, gold_heads)
+
+	with timing.stage('write'):
+		for outfile in out_files:
+			outfile.close()
+	if '--stats' in opts:
+		timing.write(opts['--stats'])
+	if profiler is not None:
+		profiler.stop()
+		profiler.write(output_prefix)
 
 
 if __name__ == '__main__':